@@ -28,12 +28,7 @@ if not db_url:
 config.set_main_option("sqlalchemy.url", db_url)
 
 from app.db.base import Base  # noqa: E402
-from app.models import study  # noqa: F401, E402
-from app.models import scenario  # noqa: F401, E402
-from app.models import inventory  # noqa: F401, E402
-from app.models import shipment  # noqa: F401, E402
-from app.models import subject  # noqa: F401, E402
-from app.models import user  # noqa: F401, E402
+import app.models  # noqa: F401, E402  (registers every table on Base.metadata)
 
 target_metadata = Base.metadata
 
@@ -52,6 +47,9 @@ def run_migrations_offline() -> None:
 
 
 def run_migrations_online() -> None:
+    # NullPool is fine: every revision in a run (including autocommit_block
+    # sections for concurrent index builds) executes on the single connection
+    # opened below, so no handshake is repeated per operation.
     connectable = engine_from_config(
         config.get_section(config.config_ini_section) or {},
         prefix="sqlalchemy.",
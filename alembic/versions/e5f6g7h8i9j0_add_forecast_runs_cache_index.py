@@ -0,0 +1,40 @@
+"""add partial index for the forecast run cache lookup
+
+Revision ID: e5f6g7h8i9j0
+Revises: d4e5f6g7h8i9
+Create Date: 2026-10-15 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'e5f6g7h8i9j0'
+down_revision: Union[str, None] = 'd4e5f6g7h8i9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Matches _get_or_run_forecast: equality on (scenario_version_id, input_hash),
+    # status = 'SUCCESS', ORDER BY finished_at DESC LIMIT 1
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_forecast_runs_cache',
+            'forecast_runs',
+            ['scenario_version_id', 'input_hash', sa.text('finished_at DESC')],
+            postgresql_where=sa.text("status = 'SUCCESS'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_forecast_runs_cache',
+            table_name='forecast_runs',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,84 @@
+"""keep at most one SUCCESS forecast run per cache key
+
+Revision ID: f6g7h8i9j0k1
+Revises: e5f6g7h8i9j0
+Create Date: 2026-10-15 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'f6g7h8i9j0k1'
+down_revision: Union[str, None] = 'e5f6g7h8i9j0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Demote all but the newest SUCCESS row per cache key. Rows are kept (report
+    # links may reference them) and still carry their outputs.
+    op.execute(
+        """
+        UPDATE forecast_runs fr
+        SET status = 'SUPERSEDED'
+        FROM (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY scenario_version_id, input_hash
+                       ORDER BY finished_at DESC NULLS LAST, id
+                   ) AS rn
+            FROM forecast_runs
+            WHERE status = 'SUCCESS'
+        ) ranked
+        WHERE fr.id = ranked.id AND ranked.rn > 1
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        # A failed concurrent build (e.g. a SUCCESS duplicate committed by the
+        # running app after the demotion) leaves an INVALID index behind, which
+        # ON CONFLICT cannot use. Drop any leftover and build from scratch
+        # rather than letting IF NOT EXISTS keep it.
+        op.drop_index(
+            'uq_forecast_runs_cache',
+            table_name='forecast_runs',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            'uq_forecast_runs_cache',
+            'forecast_runs',
+            ['scenario_version_id', 'input_hash'],
+            unique=True,
+            postgresql_where=sa.text("status = 'SUCCESS'"),
+            postgresql_concurrently=True,
+        )
+        # Only reached once the build succeeded, i.e. the new index is valid.
+        # The unique index serves the cache lookup on its own
+        op.drop_index(
+            'ix_forecast_runs_cache',
+            table_name='forecast_runs',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    # SUPERSEDED rows are left as they are.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_forecast_runs_cache',
+            'forecast_runs',
+            ['scenario_version_id', 'input_hash', sa.text('finished_at DESC')],
+            postgresql_where=sa.text("status = 'SUCCESS'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'uq_forecast_runs_cache',
+            table_name='forecast_runs',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
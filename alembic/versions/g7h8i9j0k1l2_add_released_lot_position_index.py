@@ -0,0 +1,41 @@
+"""add covering index for released inventory positions
+
+Revision ID: g7h8i9j0k1l2
+Revises: f6g7h8i9j0k1
+Create Date: 2026-10-15 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'g7h8i9j0k1l2'
+down_revision: Union[str, None] = 'f6g7h8i9j0k1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # list_positions groups RELEASED lots by (node, product, presentation) and
+    # aggregates qty_on_hand / expiry_date — all served from this index.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_inventory_lots_released_position',
+            'inventory_lots',
+            ['node_id', 'product_id', 'presentation_id'],
+            postgresql_include=['qty_on_hand', 'expiry_date'],
+            postgresql_where=sa.text("status = 'RELEASED'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_inventory_lots_released_position',
+            table_name='inventory_lots',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
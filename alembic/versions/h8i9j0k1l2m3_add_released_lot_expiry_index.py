@@ -0,0 +1,40 @@
+"""add index for paging released lots by expiry
+
+Revision ID: h8i9j0k1l2m3
+Revises: g7h8i9j0k1l2
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'h8i9j0k1l2m3'
+down_revision: Union[str, None] = 'g7h8i9j0k1l2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Matches list_lots: ORDER BY expiry_date ASC NULLS LAST, id — the default
+    # btree ordering — so pages of RELEASED lots come straight off the index.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_inventory_lots_released_expiry',
+            'inventory_lots',
+            ['expiry_date', 'id'],
+            postgresql_where=sa.text("status = 'RELEASED'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_inventory_lots_released_expiry',
+            table_name='inventory_lots',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
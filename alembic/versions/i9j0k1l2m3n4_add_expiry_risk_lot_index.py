@@ -0,0 +1,44 @@
+"""add covering index for the expiry-risk report
+
+Revision ID: i9j0k1l2m3n4
+Revises: h8i9j0k1l2m3
+Create Date: 2026-10-15 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'i9j0k1l2m3n4'
+down_revision: Union[str, None] = 'h8i9j0k1l2m3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # export_expiry_risk_csv: RELEASED lots with stock, expiry_date <= cutoff,
+    # ordered by expiry_date. INCLUDE carries every lot column the report
+    # reads, so the range is an index-only scan with no sort.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_inventory_lots_expiry_risk',
+            'inventory_lots',
+            ['expiry_date'],
+            postgresql_include=[
+                'node_id', 'product_id', 'presentation_id', 'lot_number', 'status', 'qty_on_hand',
+            ],
+            postgresql_where=sa.text("status = 'RELEASED' AND qty_on_hand > 0"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_inventory_lots_expiry_risk',
+            table_name='inventory_lots',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,34 @@
+"""stamp inventory_lots.updated_at with the database clock
+
+Revision ID: j0k1l2m3n4o5
+Revises: i9j0k1l2m3n4
+Create Date: 2026-10-15 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'j0k1l2m3n4o5'
+down_revision: Union[str, None] = 'i9j0k1l2m3n4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column(
+        'inventory_lots',
+        'updated_at',
+        existing_type=sa.DateTime(timezone=True),
+        server_default=sa.text('now()'),
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'inventory_lots',
+        'updated_at',
+        existing_type=sa.DateTime(timezone=True),
+        server_default=None,
+    )
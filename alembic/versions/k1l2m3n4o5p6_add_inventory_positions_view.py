@@ -0,0 +1,49 @@
+"""add mv_inventory_positions materialized view
+
+Revision ID: k1l2m3n4o5p6
+Revises: j0k1l2m3n4o5
+Create Date: 2026-10-15 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = 'k1l2m3n4o5p6'
+down_revision: Union[str, None] = 'j0k1l2m3n4o5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # RELEASED stock per node/product/presentation, read by list_positions
+    # and refreshed by the app's positions refresher.
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW mv_inventory_positions AS
+        SELECT
+            n.study_id,
+            n.node_id,
+            n.name AS node_name,
+            l.product_id,
+            l.presentation_id,
+            SUM(l.qty_on_hand) AS total_qty,
+            COUNT(*) AS lot_count,
+            MIN(l.expiry_date) AS earliest_expiry
+        FROM inventory_nodes n
+        JOIN inventory_lots l ON l.node_id = n.id
+        WHERE l.status = 'RELEASED'
+        GROUP BY n.study_id, n.node_id, n.name, l.product_id, l.presentation_id
+        """
+    )
+    # REFRESH ... CONCURRENTLY needs a unique index over all rows; NULL
+    # presentations group together, so they must not count as distinct.
+    op.execute(
+        "CREATE UNIQUE INDEX uq_mv_inventory_positions "
+        "ON mv_inventory_positions (node_id, product_id, presentation_id) NULLS NOT DISTINCT"
+    )
+    op.execute("CREATE INDEX ix_mv_inventory_positions_study ON mv_inventory_positions (study_id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_inventory_positions")
@@ -0,0 +1,39 @@
+"""add index for paging transactions by creation time
+
+Revision ID: l2m3n4o5p6q7
+Revises: k1l2m3n4o5p6
+Create Date: 2026-10-15 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = 'l2m3n4o5p6q7'
+down_revision: Union[str, None] = 'k1l2m3n4o5p6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # list_transactions orders by created_at DESC, id DESC and pages with a
+    # (created_at, id) < cursor predicate; a backward scan of this index
+    # serves both without a sort.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_inventory_transactions_created',
+            'inventory_transactions',
+            ['created_at', 'id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_inventory_transactions_created',
+            table_name='inventory_transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,49 @@
+"""add indexes for the newest-first study, scenario and shipment lists
+
+Revision ID: m3n4o5p6q7r8
+Revises: l2m3n4o5p6q7
+Create Date: 2026-10-15 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = 'm3n4o5p6q7r8'
+down_revision: Union[str, None] = 'l2m3n4o5p6q7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns). Each list orders by a timestamp DESC with LIMIT,
+# optionally behind an equality filter; a backward scan of the matching
+# index returns the page without sorting the table.
+_INDEXES = [
+    ('ix_studies_created', 'studies', ['created_at']),
+    ('ix_scenarios_created', 'scenarios', ['created_at']),
+    ('ix_scenarios_study_created', 'scenarios', ['study_id', 'created_at']),
+    ('ix_shipments_requested', 'shipments', ['requested_at']),
+    ('ix_shipments_status_requested', 'shipments', ['status', 'requested_at']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in _INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(_INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -0,0 +1,38 @@
+"""add index for the newest-first subject list
+
+Revision ID: n4o5p6q7r8s9
+Revises: m3n4o5p6q7r8
+Create Date: 2026-10-15 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = 'n4o5p6q7r8s9'
+down_revision: Union[str, None] = 'm3n4o5p6q7r8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # list_subjects orders by (created_at, id) DESC and pages by keyset on the
+    # same pair — a backward scan of this index serves every page.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_subjects_created',
+            'subjects',
+            ['created_at', 'id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_subjects_created',
+            table_name='subjects',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
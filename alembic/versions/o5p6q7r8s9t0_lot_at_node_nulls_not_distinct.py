@@ -0,0 +1,80 @@
+"""make the one-lot-per-node key treat NULL presentations as equal
+
+Revision ID: o5p6q7r8s9t0
+Revises: n4o5p6q7r8s9
+Create Date: 2026-10-15 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'o5p6q7r8s9t0'
+down_revision: Union[str, None] = 'n4o5p6q7r8s9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # uq_lot_at_node lets any number of lots without a presentation share a
+    # key, so concurrent WMS feeds could both insert one. The replacement
+    # (PostgreSQL 15+) counts NULLs as equal, and ON CONFLICT infers it.
+    if not op.get_context().as_sql:
+        # GROUP BY treats NULLs as equal, like the new index
+        duplicates = op.get_bind().execute(sa.text(
+            """
+            SELECT node_id, product_id, presentation_id, lot_number, count(*) AS n
+            FROM inventory_lots
+            GROUP BY node_id, product_id, presentation_id, lot_number
+            HAVING count(*) > 1
+            ORDER BY n DESC
+            LIMIT 10
+            """
+        )).all()
+        if duplicates:
+            listed = "; ".join(
+                f"node {r.node_id} product {r.product_id} presentation {r.presentation_id} "
+                f"lot {r.lot_number} x{r.n}"
+                for r in duplicates
+            )
+            raise RuntimeError(
+                "inventory_lots has duplicate (node_id, product_id, presentation_id, "
+                f"lot_number) rows; merge them before upgrading. First groups: {listed}"
+            )
+
+    with op.get_context().autocommit_block():
+        # A failed concurrent build (duplicates written after the check above)
+        # leaves an INVALID index, which ON CONFLICT ignores. Drop any leftover
+        # and build from scratch rather than letting IF NOT EXISTS keep it.
+        op.drop_index(
+            'uq_inventory_lots_lot_at_node',
+            table_name='inventory_lots',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            'uq_inventory_lots_lot_at_node',
+            'inventory_lots',
+            ['node_id', 'product_id', 'presentation_id', 'lot_number'],
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+            postgresql_concurrently=True,
+        )
+    # Only reached once the build succeeded, i.e. the new index is valid
+    op.drop_constraint('uq_lot_at_node', 'inventory_lots', type_='unique')
+
+
+def downgrade() -> None:
+    op.create_unique_constraint(
+        'uq_lot_at_node',
+        'inventory_lots',
+        ['node_id', 'product_id', 'presentation_id', 'lot_number'],
+    )
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'uq_inventory_lots_lot_at_node',
+            table_name='inventory_lots',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -3,18 +3,21 @@ from __future__ import annotations
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from app.core.audit import log_action
+from app.core.audit import queue_action
 from app.core.auth import (
     create_token,
     hash_password,
+    password_needs_rehash,
     require_admin,
     require_auth,
     verify_password,
 )
-from app.db.session import get_db
+from app.db.session import get_async_db
 from app.models.user import AuditLog, User
 from app.schemas.user import (
     AuditLogOut,
@@ -30,29 +33,30 @@ VALID_ROLES = {"ADMIN", "SUPPLY_CHAIN", "SITE", "READONLY"}
 
 
 @router.post("/auth/register", response_model=UserOut)
-def register(body: UserRegister, request: Request, db: Session = Depends(get_db)):
+async def register(body: UserRegister, request: Request, db: AsyncSession = Depends(get_async_db)):
     role = body.role.upper()
     if role not in VALID_ROLES:
         raise HTTPException(status_code=400, detail=f"Invalid role. Must be one of: {VALID_ROLES}")
 
-    existing = db.execute(
-        select(User).where((User.username == body.username) | (User.email == body.email))
-    ).scalar_one_or_none()
-    if existing:
+    hashed_password = await run_in_threadpool(hash_password, body.password)
+    # ix_users_username / ix_users_email are unique — let them reject duplicates.
+    # RETURNING hands back the full row, so no refresh SELECT is needed.
+    try:
+        user = (await db.execute(
+            insert(User).values(
+                username=body.username,
+                email=body.email,
+                hashed_password=hashed_password,
+                role=role,
+                tenant_id=body.tenant_id,
+            ).returning(User)
+        )).scalar_one()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(status_code=409, detail="Username or email already registered")
 
-    user = User(
-        username=body.username,
-        email=body.email,
-        hashed_password=hash_password(body.password),
-        role=role,
-        tenant_id=body.tenant_id,
-    )
-    db.add(user)
-    db.flush()
-
-    log_action(
-        db,
+    queue_action(
         action="REGISTER",
         resource_type="USER",
         resource_id=str(user.id),
@@ -60,24 +64,31 @@ def register(body: UserRegister, request: Request, db: Session = Depends(get_db)
         username=user.username,
         ip_address=request.client.host if request.client else None,
     )
-
-    db.commit()
-    db.refresh(user)
     return user
 
 
 @router.post("/auth/login", response_model=TokenOut)
-def login(body: UserLogin, request: Request, db: Session = Depends(get_db)):
-    user = db.execute(
+async def login(body: UserLogin, request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(
         select(User).where(User.username == body.username)
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
 
-    if not user or not verify_password(body.password, user.hashed_password):
+    # Password hashing is deliberately slow — keep it off the event loop
+    if not user or not await run_in_threadpool(verify_password, body.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     if not user.is_active:
         raise HTTPException(status_code=403, detail="Account is disabled")
 
+    # Upgrade v1 PBKDF2 hashes now that the plaintext is known to be correct
+    if password_needs_rehash(user.hashed_password):
+        await db.execute(
+            update(User)
+            .where(User.id == user.id)
+            .values(hashed_password=await run_in_threadpool(hash_password, body.password))
+        )
+        await db.commit()
+
     token = create_token(
         user_id=str(user.id),
         username=user.username,
@@ -85,8 +96,7 @@ def login(body: UserLogin, request: Request, db: Session = Depends(get_db)):
         tenant_id=user.tenant_id,
     )
 
-    log_action(
-        db,
+    queue_action(
         action="LOGIN",
         resource_type="USER",
         resource_id=str(user.id),
@@ -94,7 +104,6 @@ def login(body: UserLogin, request: Request, db: Session = Depends(get_db)):
         username=user.username,
         ip_address=request.client.host if request.client else None,
     )
-    db.commit()
 
     return TokenOut(
         access_token=token,
@@ -104,34 +113,43 @@ def login(body: UserLogin, request: Request, db: Session = Depends(get_db)):
 
 
 @router.get("/auth/me", response_model=UserOut)
-def get_me(current_user: dict = Depends(require_auth), db: Session = Depends(get_db)):
-    user = db.get(User, UUID(current_user["sub"]))
+async def get_me(current_user: dict = Depends(require_auth), db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(User, UUID(current_user["sub"]))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
 @router.get("/auth/users", response_model=list[UserOut])
-def list_users(
+async def list_users(
     current_user: dict = Depends(require_admin),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    rows = db.execute(
-        select(User).order_by(User.created_at.desc()).offset(skip).limit(limit)
-    ).scalars().all()
+    # Project only the UserOut columns — skips hashed_password and entity hydration
+    rows = (await db.execute(
+        select(
+            User.id,
+            User.username,
+            User.email,
+            User.role,
+            User.is_active,
+            User.tenant_id,
+            User.created_at,
+        ).order_by(User.created_at.desc()).offset(skip).limit(limit)
+    )).mappings().all()
     return rows
 
 
 @router.get("/audit-logs", response_model=list[AuditLogOut])
-def list_audit_logs(
+async def list_audit_logs(
     current_user: dict = Depends(require_admin),
     action: str | None = Query(None),
     resource_type: str | None = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     q = select(AuditLog)
     if action:
@@ -139,4 +157,4 @@ def list_audit_logs(
     if resource_type:
         q = q.where(AuditLog.resource_type == resource_type.upper())
     q = q.order_by(AuditLog.created_at.desc()).offset(skip).limit(limit)
-    return db.execute(q).scalars().all()
+    return (await db.execute(q)).scalars().all()
@@ -1,18 +1,22 @@
 from __future__ import annotations
 
+import logging
 from datetime import UTC, datetime
+from operator import sub
 from uuid import UUID
 
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from app.core.constants import ENGINE_VERSION
 from app.core.hashing import stable_hash
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_async_db
 from app.models.scenario import ForecastRun, ScenarioVersion
 from app.schemas.forecast import (
     ForecastCompareResponse,
@@ -28,93 +32,169 @@ class ForecastRunRequest(BaseModel):
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
 
-def _get_or_run_forecast(sv: ScenarioVersion, db: Session) -> dict:
+
+def _input_hash(sv: ScenarioVersion) -> str:
+    """Forecast cache key for a version.
+
+    ``payload_hash`` is computed with ``stable_hash`` when the version is
+    inserted and the payload is immutable afterwards, so reuse it instead of
+    re-serializing the payload on every request.
+    """
+    return sv.payload_hash or stable_hash(sv.payload)
+
+
+def _lock_cache_slot(scenario_version_id: UUID, input_hash: str):
+    """Statement taking a transaction-scoped advisory lock on one cache key.
+
+    Every writer of a SUCCESS row for the key holds it until commit, so a
+    promotion cannot race another run's promotion or cache insert into
+    uq_forecast_runs_cache.
+    """
+    key = f"forecast_runs:{scenario_version_id}:{input_hash}"
+    return select(func.pg_advisory_xact_lock(func.hashtextextended(key, 0)))
+
+
+async def _get_or_run_forecast(sv: ScenarioVersion, db: AsyncSession) -> dict:
     """Check for a cached ForecastRun by input_hash; run if missing."""
-    input_hash = stable_hash(sv.payload)
+    input_hash = _input_hash(sv)
 
-    cached = db.execute(
-        select(ForecastRun).where(
+    # Probe uq_forecast_runs_cache for just the outputs column — no ForecastRun
+    # entity is hydrated, and outputs are only read when there is a hit. The
+    # index is unique, so this is a plain equality lookup.
+    cached_outputs = (await db.execute(
+        select(ForecastRun.outputs).where(
             ForecastRun.scenario_version_id == sv.id,
             ForecastRun.input_hash == input_hash,
             ForecastRun.status == "SUCCESS",
-        ).order_by(ForecastRun.finished_at.desc()).limit(1)
-    ).scalar_one_or_none()
+        )
+    )).scalar_one_or_none()
 
-    if cached and cached.outputs:
-        return cached.outputs
+    if cached_outputs:
+        return cached_outputs
 
-    outputs = run_forecast(sv.payload)
+    # The engine is CPU-bound; keep it off the event loop
+    started_at = datetime.now(UTC)
+    outputs = await run_in_threadpool(run_forecast, sv.payload)
+    finished_at = datetime.now(UTC)
 
-    fr = ForecastRun(
-        scenario_version_id=sv.id,
-        engine_version=ENGINE_VERSION,
-        input_hash=input_hash,
-        status="SUCCESS",
-        started_at=datetime.now(UTC),
-        finished_at=datetime.now(UTC),
-        outputs=outputs,
+    await db.execute(_lock_cache_slot(sv.id, input_hash))
+    await db.execute(
+        insert(ForecastRun).values(
+            scenario_version_id=sv.id,
+            engine_version=ENGINE_VERSION,
+            input_hash=input_hash,
+            status="SUCCESS",
+            started_at=started_at,
+            finished_at=finished_at,
+            outputs=outputs,
+        ).on_conflict_do_nothing(
+            # A concurrent caller already cached this key
+            index_elements=[ForecastRun.scenario_version_id, ForecastRun.input_hash],
+            # Literal predicate: a bound parameter can't be matched to the
+            # partial index during ON CONFLICT inference.
+            index_where=text("status = 'SUCCESS'"),
+        )
     )
-    db.add(fr)
-    db.commit()
+    await db.commit()
 
     return outputs
 
 
+def _execute_forecast_run(forecast_run_id: UUID) -> None:
+    """Run a queued forecast and record SUCCESS/FAILED on its ForecastRun row.
+
+    Runs after the response has been sent, so it owns its own session. Any
+    error, not just one from the engine, leaves the row FAILED rather than
+    RUNNING, so pollers always see the run finish.
+    """
+    db = SessionLocal()
+    try:
+        fr = db.get(ForecastRun, forecast_run_id)
+        if fr is None:
+            return
+        sv = db.get(ScenarioVersion, fr.scenario_version_id)
+        try:
+            outputs = run_forecast(sv.payload)
+        except Exception as e:
+            fr.status = "FAILED"
+            fr.outputs = {"error": str(e)}
+        else:
+            # Newest run wins the cache slot; demote the previous SUCCESS row
+            # before taking it so uq_forecast_runs_cache stays satisfied. The
+            # lock makes the demotion see any SUCCESS row committed by a
+            # concurrent run for the same key.
+            db.execute(_lock_cache_slot(fr.scenario_version_id, fr.input_hash))
+            db.execute(
+                update(ForecastRun)
+                .where(
+                    ForecastRun.scenario_version_id == fr.scenario_version_id,
+                    ForecastRun.input_hash == fr.input_hash,
+                    ForecastRun.status == "SUCCESS",
+                )
+                .values(status="SUPERSEDED")
+            )
+            fr.status = "SUCCESS"
+            fr.outputs = outputs
+        fr.finished_at = datetime.now(UTC)
+        db.commit()
+    except Exception as e:
+        logger.exception("Forecast run %s failed", forecast_run_id)
+        db.rollback()
+        try:
+            db.execute(
+                update(ForecastRun)
+                .where(ForecastRun.id == forecast_run_id)
+                .values(status="FAILED", outputs={"error": str(e)}, finished_at=datetime.now(UTC))
+            )
+            db.commit()
+        except Exception:
+            logger.exception("Could not mark forecast run %s FAILED", forecast_run_id)
+    finally:
+        db.close()
+
+
 @router.post("/forecast/run", response_model=ForecastRunCreateResponse)
-def run_forecast_for_version(
+async def run_forecast_for_version(
     body: ForecastRunRequest,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """Queue a forecast run; poll GET /forecast/runs/{id} for the result."""
     # Resolve ScenarioVersion from scenario_id + optional version number
     if body.version is not None:
-        sv = db.execute(
+        sv = (await db.execute(
             select(ScenarioVersion).where(
                 ScenarioVersion.scenario_id == body.scenario_id,
                 ScenarioVersion.version == body.version,
             )
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
     else:
         # Use latest version
-        sv = db.execute(
+        sv = (await db.execute(
             select(ScenarioVersion)
             .where(ScenarioVersion.scenario_id == body.scenario_id)
             .order_by(ScenarioVersion.version.desc())
             .limit(1)
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
 
     if not sv:
         raise HTTPException(status_code=404, detail="ScenarioVersion not found")
 
-    scenario_version_id = sv.id
+    fr = (await db.execute(
+        insert(ForecastRun).values(
+            scenario_version_id=sv.id,
+            engine_version=ENGINE_VERSION,
+            input_hash=_input_hash(sv),
+            status="RUNNING",
+            started_at=datetime.now(UTC),
+            outputs=None,
+        ).returning(ForecastRun)
+    )).scalar_one()
+    await db.commit()
 
-    input_hash = stable_hash(sv.payload)
-
-    fr = ForecastRun(
-        scenario_version_id=scenario_version_id,
-        engine_version=ENGINE_VERSION,
-        input_hash=input_hash,
-        status="RUNNING",
-        started_at=datetime.now(UTC),
-        outputs=None,
-    )
-    db.add(fr)
-    db.commit()
-    db.refresh(fr)
-
-    try:
-        outputs = run_forecast(sv.payload)
-        fr.outputs = outputs
-        fr.status = "SUCCESS"
-        fr.finished_at = datetime.now(UTC)
-        db.commit()
-        db.refresh(fr)
-    except Exception as e:
-        fr.status = "FAILED"
-        fr.outputs = {"error": str(e)}
-        fr.finished_at = datetime.now(UTC)
-        db.commit()
-        raise
+    background_tasks.add_task(_execute_forecast_run, fr.id)
 
     return ForecastRunCreateResponse(
         forecast_run_id=fr.id,
@@ -125,59 +205,70 @@ def run_forecast_for_version(
 
 
 @router.get("/forecast/runs/{forecast_run_id}", response_model=ForecastRunOut)
-def get_forecast_run(forecast_run_id: UUID, db: Session = Depends(get_db)):
-    fr = db.get(ForecastRun, forecast_run_id)
-    if not fr:
+async def get_forecast_run(
+    forecast_run_id: UUID,
+    include: str | None = Query(None, description="Pass 'outputs' to include the forecast outputs"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # outputs is a large, TOASTed JSONB column — only read it when asked for,
+    # so status polls stay cheap.
+    columns = [
+        ForecastRun.id,
+        ForecastRun.scenario_version_id,
+        ForecastRun.engine_version,
+        ForecastRun.status,
+        ForecastRun.started_at,
+        ForecastRun.finished_at,
+    ]
+    if include == "outputs":
+        columns.append(ForecastRun.outputs)
+    row = (await db.execute(
+        select(*columns).where(ForecastRun.id == forecast_run_id)
+    )).mappings().one_or_none()
+    if not row:
         raise HTTPException(status_code=404, detail="ForecastRun not found")
-    return ForecastRunOut(
-        id=fr.id,
-        scenario_version_id=fr.scenario_version_id,
-        engine_version=fr.engine_version,
-        status=fr.status,
-        started_at=fr.started_at,
-        finished_at=fr.finished_at,
-        outputs=fr.outputs,
-    )
+    return ForecastRunOut(**row)
 
 
 @router.get("/forecast/compare", response_model=ForecastCompareResponse)
-def compare_versions(
+async def compare_versions(
     scenario_id: UUID = Query(...),
     version_a: int = Query(..., alias="a", description="Scenario version number A"),
     version_b: int = Query(..., alias="b", description="Scenario version number B"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    sva = db.execute(
-        select(ScenarioVersion).where(
-            ScenarioVersion.scenario_id == scenario_id,
-            ScenarioVersion.version == version_a,
-        )
-    ).scalar_one_or_none()
-    svb = db.execute(
+    rows = (await db.execute(
         select(ScenarioVersion).where(
             ScenarioVersion.scenario_id == scenario_id,
-            ScenarioVersion.version == version_b,
+            ScenarioVersion.version.in_([version_a, version_b]),
         )
-    ).scalar_one_or_none()
+    )).scalars().all()
+    by_version = {r.version: r for r in rows}
+    sva = by_version.get(version_a)
+    svb = by_version.get(version_b)
 
     if not sva or not svb:
         raise HTTPException(status_code=404, detail="One or both scenario versions not found")
 
-    out_a = _get_or_run_forecast(sva, db)
-    out_b = _get_or_run_forecast(svb, db)
+    out_a = await _get_or_run_forecast(sva, db)
+    out_b = await _get_or_run_forecast(svb, db)
 
     enrolled_a = out_a["enrolled_per_bucket"]
     enrolled_b = out_b["enrolled_per_bucket"]
-    delta_enrolled = [eb - ea for ea, eb in zip(enrolled_a, enrolled_b)]
+    delta_enrolled = list(map(sub, enrolled_b, enrolled_a))
 
     demand_a = out_a["demand"]
     demand_b = out_b["demand"]
-    all_keys = set(demand_a.keys()) | set(demand_b.keys())
-    demand_delta = {}
-    for k in all_keys:
-        da = demand_a.get(k, [0.0] * len(enrolled_a))
-        db_vals = demand_b.get(k, [0.0] * len(enrolled_b))
-        demand_delta[k] = [y - x for x, y in zip(da, db_vals)]
+    # A key missing on one side counts as zero demand there, so the delta is
+    # just the other side's series (negated for A-only keys).
+    demand_delta = {
+        k: list(map(sub, demand_b[k], demand_a[k]))
+        for k in demand_a.keys() & demand_b.keys()
+    }
+    for k in demand_a.keys() - demand_b.keys():
+        demand_delta[k] = [0.0 - x for x in demand_a[k]]
+    for k in demand_b.keys() - demand_a.keys():
+        demand_delta[k] = list(demand_b[k])
 
     return ForecastCompareResponse(
         scenario_id=scenario_id,
@@ -11,22 +11,77 @@ real external systems.
 """
 from __future__ import annotations
 
+import json
 from datetime import UTC, datetime
-from typing import Any, Dict, List, Optional
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ConfigDict
-from sqlalchemy import select
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.core import ingest
+from app.core.cache import subjects_cache
+from app.core.positions import invalidate_positions
+from app.db.bulk import bulk_insert
+from app.db.session import SessionLocal, get_db
 from app.models.inventory import InventoryLot, InventoryNode, InventoryTransaction
+from app.models.shipment import Shipment
 from app.models.subject import Subject
 
 router = APIRouter()
 
 
+# ---------------------------------------------------------------------------
+# Ingest jobs — feeds are processed off the request path (app.core.ingest)
+# ---------------------------------------------------------------------------
+
+
+class IngestJobOut(BaseModel):
+    model_config = ConfigDict(extra="forbid", from_attributes=True)
+    id: UUID
+    kind: str
+    status: str
+    enqueued_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class IngestStats(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    queue_depth: int
+    submitted: int
+    dropped: int
+    succeeded: int
+    failed: int
+
+
+def _submit_job(kind: str, handler: Callable[[], BaseModel]) -> ingest.IngestJob:
+    try:
+        return ingest.submit(kind, handler)
+    except ingest.IngestQueueFull:
+        raise HTTPException(status_code=503, detail="Ingest queue is full, retry later")
+
+
+@router.get("/integrations/jobs/stats", response_model=IngestStats)
+def get_ingest_stats():
+    return ingest.ingest_stats()
+
+
+@router.get("/integrations/jobs/{job_id}", response_model=IngestJobOut)
+def get_ingest_job(job_id: UUID):
+    job = ingest.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 # ---------------------------------------------------------------------------
 # IRT Import — enrollment actuals
 # ---------------------------------------------------------------------------
@@ -54,48 +109,60 @@ class IRTImportResult(BaseModel):
     errors: List[str]
 
 
-@router.post("/integrations/irt/import-subjects", response_model=IRTImportResult)
-def import_irt_subjects(body: IRTImportRequest, db: Session = Depends(get_db)):
-    """Import subject enrollment data from an IRT system."""
+def _import_irt_subjects(body: IRTImportRequest) -> IRTImportResult:
+    """Ingest worker job: import subject enrollment data from an IRT system."""
+    with SessionLocal() as db:
+        return _import_irt_subjects_into(db, body)
+
+
+def _import_irt_subjects_into(db: Session, body: IRTImportRequest) -> IRTImportResult:
     imported = 0
     skipped = 0
     errors: list[str] = []
 
+    # Resolve duplicates and site nodes for the whole batch up front
+    incoming = {s.subject_number for s in body.subjects}
+    site_ids = {s.site_node_id for s in body.subjects if s.site_node_id}
+    existing = set(db.scalars(
+        select(Subject.subject_number).where(Subject.subject_number.in_(incoming))
+    ))
+    node_map = dict(db.execute(
+        select(InventoryNode.node_id, InventoryNode.id).where(InventoryNode.node_id.in_(site_ids))
+    ).all()) if site_ids else {}
+
+    new_subjects: list[Subject] = []
     for s in body.subjects:
-        existing = db.execute(
-            select(Subject).where(Subject.subject_number == s.subject_number)
-        ).scalar_one_or_none()
-
-        if existing:
+        if s.subject_number in existing:
             skipped += 1
             continue
 
-        site_uuid = None
-        if s.site_node_id:
-            node = db.execute(
-                select(InventoryNode).where(InventoryNode.node_id == s.site_node_id)
-            ).scalar_one_or_none()
-            if node:
-                site_uuid = node.id
-
         try:
             subject = Subject(
                 subject_number=s.subject_number,
                 cohort_id=s.cohort_id,
-                site_node_id=site_uuid,
+                site_node_id=node_map.get(s.site_node_id) if s.site_node_id else None,
                 status=s.status.upper(),
                 enrolled_at=datetime.now(UTC) if s.status.upper() in ("ENROLLED", "ACTIVE") else None,
                 attributes={"source": body.source_system},
             )
-            db.add(subject)
+            new_subjects.append(subject)
+            existing.add(s.subject_number)
             imported += 1
         except Exception as e:
             errors.append(f"{s.subject_number}: {str(e)}")
 
+    db.add_all(new_subjects)
     db.commit()
+    subjects_cache.clear()
     return IRTImportResult(imported=imported, skipped=skipped, errors=errors)
 
 
+@router.post("/integrations/irt/import-subjects", response_model=IngestJobOut, status_code=202)
+async def import_irt_subjects(body: IRTImportRequest):
+    """Queue an IRT subject import; poll GET /integrations/jobs/{id} for the result."""
+    return _submit_job("IRT_IMPORT", partial(_import_irt_subjects, body))
+
+
 # ---------------------------------------------------------------------------
 # IRT Export — current enrollment status
 # ---------------------------------------------------------------------------
@@ -109,19 +176,49 @@ class IRTSubjectExport(BaseModel):
     enrolled_at: Optional[str]
 
 
-@router.get("/integrations/irt/export-subjects", response_model=list[IRTSubjectExport])
-def export_irt_subjects(db: Session = Depends(get_db)):
-    """Export current subject enrollment status for IRT reconciliation."""
-    subjects = db.execute(select(Subject).order_by(Subject.subject_number)).scalars().all()
-    return [
-        IRTSubjectExport(
-            subject_number=s.subject_number,
-            cohort_id=s.cohort_id,
-            status=s.status,
-            enrolled_at=s.enrolled_at.isoformat() if s.enrolled_at else None,
+def _stream_irt_subjects() -> Iterator[str]:
+    """Yield the subject export as a JSON array, 1000 rows per DB fetch.
+
+    Runs after the handler has returned, so it owns its own session. Each
+    fetched batch is sent as one chunk: Starlette pulls every item of a sync
+    iterator through the threadpool, so per-row items would cost a thread hop
+    and an ASGI send per row.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Subject.subject_number, Subject.cohort_id, Subject.status, Subject.enrolled_at)
+            .order_by(Subject.subject_number)
+            .execution_options(yield_per=1000)
         )
-        for s in subjects
-    ]
+        yield "["
+        sep = ""
+        for batch in rows.partitions():
+            yield sep + ",".join(
+                json.dumps({
+                    "subject_number": r.subject_number,
+                    "cohort_id": r.cohort_id,
+                    "status": r.status,
+                    "enrolled_at": r.enrolled_at.isoformat() if r.enrolled_at else None,
+                })
+                for r in batch
+            )
+            sep = ","
+        yield "]"
+    finally:
+        db.close()
+
+
+@router.get(
+    "/integrations/irt/export-subjects",
+    response_class=StreamingResponse,
+    responses={200: {"model": list[IRTSubjectExport]}},
+)
+def export_irt_subjects():
+    """Export current subject enrollment status for IRT reconciliation."""
+    # Streamed from a server-side cursor: memory stays flat however large the
+    # cohort, and rows skip per-item response-model validation.
+    return StreamingResponse(_stream_irt_subjects(), media_type="application/json")
 
 
 # ---------------------------------------------------------------------------
@@ -151,68 +248,130 @@ class WMSReceiptResult(BaseModel):
     errors: List[str]
 
 
-@router.post("/integrations/wms/receipt", response_model=WMSReceiptResult)
-def receive_wms_inventory(body: WMSReceiptRequest, db: Session = Depends(get_db)):
-    """Receive inventory from a WMS/depot feed."""
+def _receive_wms_inventory(body: WMSReceiptRequest) -> WMSReceiptResult:
+    """Ingest worker job: receive inventory from a WMS/depot feed."""
+    with SessionLocal() as db:
+        return _receive_wms_inventory_into(db, body)
+
+
+def _receive_wms_inventory_into(db: Session, body: WMSReceiptRequest) -> WMSReceiptResult:
     received = 0
     errors: list[str] = []
+    new_lots: dict[tuple, dict] = {}
+    receipts: list[tuple[tuple, UUID, float]] = []
+
+    # Preload every referenced node and existing lot in two queries. Existing
+    # lots are locked (in id order, so concurrent feeds can't deadlock) until
+    # commit, making the qty_on_hand increments below safe against lost updates.
+    node_map = {
+        n.node_id: n
+        for n in db.scalars(
+            select(InventoryNode).where(InventoryNode.node_id.in_({item.node_id for item in body.items}))
+        )
+    }
+    # Lots are keyed like uq_inventory_lots_lot_at_node. presentation_id may
+    # be NULL, which a row-value IN never matches, so the preload filters on
+    # the other three columns and the full key is matched in Python.
+    keys = {
+        (node_map[item.node_id].id, item.product_id, item.lot_number)
+        for item in body.items
+        if item.node_id in node_map
+    }
+    lot_map = {
+        (lot.node_id, lot.product_id, lot.presentation_id, lot.lot_number): lot
+        for lot in db.scalars(
+            select(InventoryLot)
+            .where(tuple_(InventoryLot.node_id, InventoryLot.product_id, InventoryLot.lot_number).in_(keys))
+            .order_by(InventoryLot.id)
+            .with_for_update()
+        )
+    } if keys else {}
 
     for item in body.items:
-        node = db.execute(
-            select(InventoryNode).where(InventoryNode.node_id == item.node_id)
-        ).scalar_one_or_none()
+        node = node_map.get(item.node_id)
         if not node:
             errors.append(f"Node '{item.node_id}' not found")
             continue
 
         # Find or create lot
-        lot = db.execute(
-            select(InventoryLot).where(
-                InventoryLot.node_id == node.id,
-                InventoryLot.product_id == item.product_id,
-                InventoryLot.lot_number == item.lot_number,
-            )
-        ).scalar_one_or_none()
+        key = (node.id, item.product_id, item.presentation_id, item.lot_number)
+        lot = lot_map.get(key)
 
         if lot:
             lot.qty_on_hand += item.qty
-            lot.updated_at = datetime.now(UTC)
+        elif key in new_lots:
+            new_lots[key]["qty_on_hand"] += item.qty
         else:
             exp_date = None
             if item.expiry_date:
                 try:
-                    from datetime import date
                     exp_date = datetime.fromisoformat(item.expiry_date)
                 except Exception:
                     pass
 
-            lot = InventoryLot(
-                node_id=node.id,
-                product_id=item.product_id,
-                presentation_id=item.presentation_id,
-                lot_number=item.lot_number,
-                expiry_date=exp_date,
-                status="RELEASED",
-                qty_on_hand=item.qty,
-            )
-            db.add(lot)
-            db.flush()
-
-        txn = InventoryTransaction(
-            lot_id=lot.id,
-            txn_type="RECEIPT",
-            qty=item.qty,
-            to_node_id=node.id,
-            reference_type="WMS_RECEIPT",
-            notes=f"Source: {body.source_system}",
-        )
-        db.add(txn)
+            new_lots[key] = {
+                "node_id": node.id,
+                "product_id": item.product_id,
+                "presentation_id": item.presentation_id,
+                "lot_number": item.lot_number,
+                "expiry_date": exp_date,
+                "status": "RELEASED",
+                "qty_on_hand": item.qty,
+            }
+
+        receipts.append((key, node.id, item.qty))
         received += 1
 
+    lot_ids = {key: lot.id for key, lot in lot_map.items()}
+    if new_lots:
+        # A concurrent feed may have created the same lot since the preload;
+        # fold into it instead of failing on uq_inventory_lots_lot_at_node.
+        stmt = pg_insert(InventoryLot).values(list(new_lots.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                InventoryLot.node_id,
+                InventoryLot.product_id,
+                InventoryLot.presentation_id,
+                InventoryLot.lot_number,
+            ],
+            set_={
+                "qty_on_hand": InventoryLot.qty_on_hand + stmt.excluded.qty_on_hand,
+                # onupdate does not apply to ON CONFLICT DO UPDATE
+                "updated_at": func.now(),
+            },
+        ).returning(
+            InventoryLot.id,
+            InventoryLot.node_id,
+            InventoryLot.product_id,
+            InventoryLot.presentation_id,
+            InventoryLot.lot_number,
+        )
+        for row in db.execute(stmt):
+            lot_ids[(row.node_id, row.product_id, row.presentation_id, row.lot_number)] = row.id
+
+    txn_rows = [
+        {
+            "lot_id": lot_ids[key],
+            "txn_type": "RECEIPT",
+            "qty": qty,
+            "to_node_id": node_uuid,
+            "reference_type": "WMS_RECEIPT",
+            "notes": f"Source: {body.source_system}",
+        }
+        for key, node_uuid, qty in receipts
+    ]
+    bulk_insert(db, InventoryTransaction, txn_rows)
     db.commit()
+    invalidate_positions()
     return WMSReceiptResult(received=received, errors=errors)
 
 
+@router.post("/integrations/wms/receipt", response_model=IngestJobOut, status_code=202)
+async def receive_wms_inventory(body: WMSReceiptRequest):
+    """Queue a WMS receipt; poll GET /integrations/jobs/{id} for the result."""
+    return _submit_job("WMS_RECEIPT", partial(_receive_wms_inventory, body))
+
+
 # ---------------------------------------------------------------------------
 # Courier tracking — update shipment status
 # ---------------------------------------------------------------------------
@@ -236,7 +395,6 @@ class CourierUpdateResult(BaseModel):
 @router.post("/integrations/courier/update", response_model=CourierUpdateResult)
 def update_courier_status(body: CourierUpdate, db: Session = Depends(get_db)):
     """Receive shipment tracking updates from courier API."""
-    from app.models.shipment import Shipment
 
     shipment = db.get(Shipment, body.shipment_id)
     if not shipment:
@@ -1,15 +1,26 @@
 from __future__ import annotations
 
-from datetime import UTC, datetime
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlalchemy import func, select
-from sqlalchemy.orm import Session
-
-from app.db.session import get_db
-from app.models.inventory import InventoryLot, InventoryNode, InventoryTransaction, InventoryVial
+from sqlalchemy import bindparam, func, insert, lambda_stmt, literal, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.cache import positions_cache
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.core.positions import invalidate_positions
+from app.core.responses import list_response
+from app.db.bulk import async_bulk_insert
+from app.db.session import get_async_db
+from app.models.inventory import (
+    InventoryLot,
+    InventoryNode,
+    InventoryTransaction,
+    InventoryVial,
+    inventory_positions_mv,
+)
 from app.schemas.inventory import (
     InventoryPosition,
     LotCreate,
@@ -21,90 +32,100 @@ from app.schemas.inventory import (
     NodeUpdate,
     TransactionCreate,
     TransactionOut,
+    TxnType,
     VialCreate,
     VialOut,
 )
 
 router = APIRouter()
 
+# Node-by-logical-id lookup is on most inventory paths; a lambda statement is
+# built and cache-keyed once instead of on every request.
+_NODE_BY_NODE_ID = lambda_stmt(
+    lambda: select(InventoryNode).where(InventoryNode.node_id == bindparam("node_id"))
+)
+
 # ---------------------------------------------------------------------------
 # Nodes
 # ---------------------------------------------------------------------------
 
 
 @router.post("/inventory/nodes", response_model=NodeOut)
-def create_node(body: NodeCreate, db: Session = Depends(get_db)):
-    existing = db.execute(
-        select(InventoryNode).where(InventoryNode.node_id == body.node_id)
-    ).scalar_one_or_none()
+async def create_node(body: NodeCreate, db: AsyncSession = Depends(get_async_db)):
+    existing = (await db.execute(_NODE_BY_NODE_ID, {"node_id": body.node_id})).scalar_one_or_none()
     if existing:
         raise HTTPException(status_code=409, detail=f"Node '{body.node_id}' already exists")
 
-    node = InventoryNode(
-        node_id=body.node_id,
-        node_type=body.node_type,
-        name=body.name,
-        country=body.country,
-        study_id=body.study_id,
-        attributes=body.attributes,
-    )
-    db.add(node)
-    db.commit()
-    db.refresh(node)
+    # RETURNING the row replaces the refresh SELECT after commit
+    node = (await db.execute(
+        insert(InventoryNode).values(**body.model_dump()).returning(*InventoryNode.__table__.columns)
+    )).mappings().one()
+    await db.commit()
     return node
 
 
 @router.get("/inventory/nodes", response_model=list[NodeOut])
-def list_nodes(
+async def list_nodes(
     study_id: UUID | None = Query(None),
     node_type: str | None = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    after: str | None = Query(None, description=f"Keyset cursor from a previous page's {NEXT_CURSOR_HEADER} header"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = select(InventoryNode)
+    # Plain column rows: only what NodeOut reads, no relationship to lazy-load
+    q = select(*InventoryNode.__table__.columns)
     if study_id:
         q = q.where(InventoryNode.study_id == study_id)
     if node_type:
         q = q.where(InventoryNode.node_type == node_type.upper())
-    q = q.order_by(InventoryNode.node_id).offset(skip).limit(limit)
-    return db.execute(q).scalars().all()
+    if after:
+        # node_id is unique, so it is the whole sort key
+        (after_node_id,) = decode_cursor(after, 1)
+        q = q.where(InventoryNode.node_id > after_node_id)
+    else:
+        q = q.offset(skip)
+    q = q.order_by(InventoryNode.node_id).limit(limit)
+    nodes = (await db.execute(q)).mappings().all()
+    headers = {}
+    if len(nodes) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(nodes[-1]["node_id"])
+    return list_response(NodeOut, nodes, headers)
 
 
 @router.get("/inventory/nodes/{node_id}", response_model=NodeOut)
-def get_node(node_id: str, db: Session = Depends(get_db)):
-    node = db.execute(
-        select(InventoryNode).where(InventoryNode.node_id == node_id)
-    ).scalar_one_or_none()
+async def get_node(node_id: str, db: AsyncSession = Depends(get_async_db)):
+    node = (await db.execute(_NODE_BY_NODE_ID, {"node_id": node_id})).scalar_one_or_none()
     if not node:
         raise HTTPException(status_code=404, detail="Node not found")
     return node
 
 
 @router.patch("/inventory/nodes/{node_id}", response_model=NodeOut)
-def update_node(node_id: str, body: NodeUpdate, db: Session = Depends(get_db)):
-    node = db.execute(
-        select(InventoryNode).where(InventoryNode.node_id == node_id)
-    ).scalar_one_or_none()
+async def update_node(node_id: str, body: NodeUpdate, db: AsyncSession = Depends(get_async_db)):
+    # UPDATE ... RETURNING: no load before the write and no refresh after it
+    columns = InventoryNode.__table__.columns
+    changes = body.model_dump(exclude_unset=True)
+    if changes:
+        q = update(InventoryNode).where(InventoryNode.node_id == node_id).values(**changes).returning(*columns)
+    else:
+        q = select(*columns).where(InventoryNode.node_id == node_id)
+    node = (await db.execute(q)).mappings().one_or_none()
     if not node:
         raise HTTPException(status_code=404, detail="Node not found")
-
-    for field, value in body.model_dump(exclude_unset=True).items():
-        setattr(node, field, value)
-    db.commit()
-    db.refresh(node)
+    await db.commit()
+    invalidate_positions()
     return node
 
 
 @router.delete("/inventory/nodes/{node_id}", status_code=204)
-def delete_node(node_id: str, db: Session = Depends(get_db)):
-    node = db.execute(
-        select(InventoryNode).where(InventoryNode.node_id == node_id)
-    ).scalar_one_or_none()
+async def delete_node(node_id: str, db: AsyncSession = Depends(get_async_db)):
+    node = (await db.execute(_NODE_BY_NODE_ID, {"node_id": node_id})).scalar_one_or_none()
     if not node:
         raise HTTPException(status_code=404, detail="Node not found")
-    db.delete(node)
-    db.commit()
+    await db.delete(node)
+    await db.commit()
+    invalidate_positions()
     return None
 
 
@@ -113,148 +134,177 @@ def delete_node(node_id: str, db: Session = Depends(get_db)):
 # ---------------------------------------------------------------------------
 
 
-def _resolve_node(db: Session, node_id_str: str) -> InventoryNode:
-    node = db.execute(
-        select(InventoryNode).where(InventoryNode.node_id == node_id_str)
-    ).scalar_one_or_none()
-    if not node:
-        raise HTTPException(status_code=404, detail=f"Node '{node_id_str}' not found")
-    return node
-
-
 @router.post("/inventory/lots", response_model=LotOut)
-def create_lot(body: LotCreate, db: Session = Depends(get_db)):
-    node = _resolve_node(db, body.node_id)
-
-    lot = InventoryLot(
-        node_id=node.id,
-        product_id=body.product_id,
-        presentation_id=body.presentation_id,
-        lot_number=body.lot_number,
-        expiry_date=body.expiry_date,
-        status=body.status.upper(),
-        qty_on_hand=body.qty_on_hand,
-    )
-    db.add(lot)
-    db.commit()
-    db.refresh(lot)
+async def create_lot(body: LotCreate, db: AsyncSession = Depends(get_async_db)):
+    # INSERT ... SELECT from the node row: the node lookup and the insert are
+    # one round-trip, and nothing is inserted when the node does not exist.
+    values = {
+        "product_id": body.product_id,
+        "presentation_id": body.presentation_id,
+        "lot_number": body.lot_number,
+        "expiry_date": body.expiry_date,
+        "status": body.status.upper(),
+        "qty_on_hand": body.qty_on_hand,
+    }
+    node_row = select(
+        InventoryNode.id,
+        *(literal(v, InventoryLot.__table__.c[k].type) for k, v in values.items()),
+    ).where(InventoryNode.node_id == body.node_id)
+    lot = (await db.execute(
+        insert(InventoryLot)
+        .from_select(["node_id", *values], node_row)
+        .returning(*InventoryLot.__table__.columns)
+    )).mappings().one_or_none()
+    if lot is None:
+        raise HTTPException(status_code=404, detail=f"Node '{body.node_id}' not found")
+    await db.commit()
+    invalidate_positions()
     return lot
 
 
 @router.get("/inventory/lots", response_model=list[LotOut])
-def list_lots(
+async def list_lots(
     study_id: UUID | None = Query(None),
     node_id: str | None = Query(None),
     product_id: str | None = Query(None),
     status: str | None = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    after: str | None = Query(None, description=f"Keyset cursor from a previous page's {NEXT_CURSOR_HEADER} header"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = select(InventoryLot)
+    q = select(*InventoryLot.__table__.columns)
+    if study_id or node_id:
+        q = q.join(InventoryNode, InventoryLot.node_id == InventoryNode.id)
     if study_id:
-        q = q.join(InventoryNode).where(InventoryNode.study_id == study_id)
+        q = q.where(InventoryNode.study_id == study_id)
     if node_id:
-        node = _resolve_node(db, node_id)
-        q = q.where(InventoryLot.node_id == node.id)
+        q = q.where(InventoryNode.node_id == node_id)
     if product_id:
         q = q.where(InventoryLot.product_id == product_id)
     if status:
         q = q.where(InventoryLot.status == status.upper())
-    q = q.order_by(InventoryLot.expiry_date.asc().nullslast()).offset(skip).limit(limit)
-    return db.execute(q).scalars().all()
+    if after:
+        # Keyset pagination over (expiry_date NULLS LAST, id): no OFFSET scan
+        # for deep pages. skip is ignored when a cursor is given.
+        after_expiry, after_id = decode_cursor(after, 2)
+        if after_expiry is None:
+            q = q.where(InventoryLot.expiry_date.is_(None), InventoryLot.id > after_id)
+        else:
+            q = q.where(or_(
+                InventoryLot.expiry_date.is_(None),
+                tuple_(InventoryLot.expiry_date, InventoryLot.id) > tuple_(after_expiry, after_id),
+            ))
+    else:
+        q = q.offset(skip)
+    q = q.order_by(InventoryLot.expiry_date.asc().nullslast(), InventoryLot.id).limit(limit)
+    lots = (await db.execute(q)).mappings().all()
+    headers = {}
+    if len(lots) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(lots[-1]["expiry_date"], lots[-1]["id"])
+    return list_response(LotOut, lots, headers)
 
 
 @router.get("/inventory/lots/{lot_id}", response_model=LotOut)
-def get_lot(lot_id: UUID, db: Session = Depends(get_db)):
-    lot = db.get(InventoryLot, lot_id)
+async def get_lot(lot_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    lot = await db.get(InventoryLot, lot_id)
     if not lot:
         raise HTTPException(status_code=404, detail="Lot not found")
     return lot
 
 
 @router.patch("/inventory/lots/{lot_id}", response_model=LotOut)
-def update_lot(lot_id: UUID, body: LotUpdate, db: Session = Depends(get_db)):
-    lot = db.get(InventoryLot, lot_id)
+async def update_lot(lot_id: UUID, body: LotUpdate, db: AsyncSession = Depends(get_async_db)):
+    # An empty patch still bumps updated_at (via onupdate), as before
+    lot = (await db.execute(
+        update(InventoryLot)
+        .where(InventoryLot.id == lot_id)
+        .values(**body.model_dump(exclude_unset=True))
+        .returning(*InventoryLot.__table__.columns)
+    )).mappings().one_or_none()
     if not lot:
         raise HTTPException(status_code=404, detail="Lot not found")
-
-    for field, value in body.model_dump(exclude_unset=True).items():
-        setattr(lot, field, value)
-    lot.updated_at = datetime.now(UTC)
-    db.commit()
-    db.refresh(lot)
+    await db.commit()
+    invalidate_positions()
     return lot
 
 
 @router.delete("/inventory/lots/{lot_id}", status_code=204)
-def delete_lot(lot_id: UUID, db: Session = Depends(get_db)):
-    lot = db.get(InventoryLot, lot_id)
+async def delete_lot(lot_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    lot = await db.get(InventoryLot, lot_id)
     if not lot:
         raise HTTPException(status_code=404, detail="Lot not found")
-    db.delete(lot)
-    db.commit()
+    await db.delete(lot)
+    await db.commit()
+    invalidate_positions()
     return None
 
 
 @router.get("/inventory/lots/{lot_id}/detail", response_model=LotWithVialsOut)
-def get_lot_detail(lot_id: UUID, db: Session = Depends(get_db)):
-    lot = db.get(InventoryLot, lot_id)
+async def get_lot_detail(
+    lot_id: UUID,
+    include_vials: bool = Query(True, description="Set false to return only the vial counts"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    q = select(InventoryLot).where(InventoryLot.id == lot_id)
+    if include_vials:
+        q = q.options(selectinload(InventoryLot.vials))
+    lot = (await db.execute(q)).scalar_one_or_none()
     if not lot:
         raise HTTPException(status_code=404, detail="Lot not found")
-    available = sum(1 for v in lot.vials if v.status == "AVAILABLE")
-    return LotWithVialsOut(
-        id=lot.id,
-        node_id=lot.node_id,
-        product_id=lot.product_id,
-        presentation_id=lot.presentation_id,
-        lot_number=lot.lot_number,
-        expiry_date=lot.expiry_date,
-        status=lot.status,
-        qty_on_hand=lot.qty_on_hand,
-        created_at=lot.created_at,
-        updated_at=lot.updated_at,
-        vials=[VialOut(
-            id=v.id,
-            lot_id=v.lot_id,
-            medication_number=v.medication_number,
-            status=v.status,
-            dispensed_at=v.dispensed_at,
-            dispensed_to_subject_id=v.dispensed_to_subject_id,
-            created_at=v.created_at,
-        ) for v in lot.vials],
-        vial_count=len(lot.vials),
-        available_count=available,
-    )
+
+    if include_vials:
+        # Vials are returned anyway, so count the loaded rows instead of
+        # issuing a separate COUNT query.
+        vials = lot.vials
+        vial_count = len(vials)
+        available = sum(v.status == "AVAILABLE" for v in vials)
+    else:
+        vials = []
+        vial_count, available = (await db.execute(
+            select(func.count(), func.count().filter(InventoryVial.status == "AVAILABLE"))
+            .where(InventoryVial.lot_id == lot_id)
+        )).one()
+
+    # Validated once, by the response model
+    return {
+        **{c.key: getattr(lot, c.key) for c in InventoryLot.__table__.columns},
+        "vials": vials,
+        "vial_count": vial_count,
+        "available_count": available,
+    }
 
 
 @router.get("/inventory/lots/{lot_id}/vials", response_model=list[VialOut])
-def list_vials(lot_id: UUID, db: Session = Depends(get_db)):
-    lot = db.get(InventoryLot, lot_id)
-    if not lot:
+async def list_vials(lot_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    vials = (await db.scalars(select(InventoryVial).where(InventoryVial.lot_id == lot_id))).all()
+    # Only an empty result needs the lot lookup to tell 404 from "no vials"
+    if not vials and await db.get(InventoryLot, lot_id) is None:
         raise HTTPException(status_code=404, detail="Lot not found")
-    return lot.vials
+    return vials
 
 
 @router.post("/inventory/lots/{lot_id}/vials", response_model=VialOut)
-def add_vial(lot_id: UUID, body: VialCreate, db: Session = Depends(get_db)):
-    lot = db.get(InventoryLot, lot_id)
+async def add_vial(lot_id: UUID, body: VialCreate, db: AsyncSession = Depends(get_async_db)):
+    lot = await db.get(InventoryLot, lot_id)
     if not lot:
         raise HTTPException(status_code=404, detail="Lot not found")
-    vial = InventoryVial(lot_id=lot_id, medication_number=body.medication_number, status=body.status)
-    db.add(vial)
-    db.commit()
-    db.refresh(vial)
+    vial = (await db.execute(
+        insert(InventoryVial)
+        .values(lot_id=lot_id, medication_number=body.medication_number, status=body.status)
+        .returning(*InventoryVial.__table__.columns)
+    )).mappings().one()
+    await db.commit()
     return vial
 
 
 @router.delete("/inventory/vials/{vial_id}", status_code=204)
-def delete_vial(vial_id: UUID, db: Session = Depends(get_db)):
-    vial = db.get(InventoryVial, vial_id)
+async def delete_vial(vial_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    vial = await db.get(InventoryVial, vial_id)
     if not vial:
         raise HTTPException(status_code=404, detail="Vial not found")
-    db.delete(vial)
-    db.commit()
+    await db.delete(vial)
+    await db.commit()
     return None
 
 
@@ -262,69 +312,107 @@ def delete_vial(vial_id: UUID, db: Session = Depends(get_db)):
 # Transactions
 # ---------------------------------------------------------------------------
 
-VALID_TXN_TYPES = {"RECEIPT", "ISSUE", "TRANSFER_OUT", "TRANSFER_IN", "RETURN", "ADJUSTMENT"}
+# Sign applied to abs(qty) per type; ADJUSTMENT takes qty as given
+_TXN_SIGN = {
+    TxnType.RECEIPT: 1,
+    TxnType.TRANSFER_IN: 1,
+    TxnType.RETURN: 1,
+    TxnType.ISSUE: -1,
+    TxnType.TRANSFER_OUT: -1,
+}
 
 
 @router.post("/inventory/transactions", response_model=TransactionOut)
-def create_transaction(body: TransactionCreate, db: Session = Depends(get_db)):
-    txn_type = body.txn_type.upper()
-    if txn_type not in VALID_TXN_TYPES:
-        raise HTTPException(status_code=400, detail=f"Invalid txn_type. Must be one of: {VALID_TXN_TYPES}")
-
-    lot = db.get(InventoryLot, body.lot_id)
-    if not lot:
-        raise HTTPException(status_code=404, detail="Lot not found")
-
-    # Apply qty change
-    if txn_type in ("RECEIPT", "TRANSFER_IN", "RETURN"):
-        lot.qty_on_hand += abs(body.qty)
-    elif txn_type in ("ISSUE", "TRANSFER_OUT"):
-        if lot.qty_on_hand < abs(body.qty):
-            raise HTTPException(status_code=400, detail="Insufficient inventory for this transaction")
-        lot.qty_on_hand -= abs(body.qty)
+async def create_transaction(body: TransactionCreate, db: AsyncSession = Depends(get_async_db)):
+    txn_type = body.txn_type
+
+    # Apply qty change in a single conditional UPDATE so concurrent
+    # transactions can't overdraw the lot or lose each other's updates.
+    stmt = update(InventoryLot).where(InventoryLot.id == body.lot_id)
+    if txn_type is TxnType.ADJUSTMENT:
+        # qty can be positive or negative; floor at zero
+        new_qty = func.greatest(InventoryLot.qty_on_hand + body.qty, 0)
     else:
-        # ADJUSTMENT — qty can be positive or negative
-        lot.qty_on_hand += body.qty
-        if lot.qty_on_hand < 0:
-            lot.qty_on_hand = 0
-
-    lot.updated_at = datetime.now(UTC)
-
-    txn = InventoryTransaction(
-        lot_id=body.lot_id,
-        txn_type=txn_type,
-        qty=body.qty,
-        from_node_id=body.from_node_id,
-        to_node_id=body.to_node_id,
-        reference_type=body.reference_type,
-        reference_id=body.reference_id,
-        notes=body.notes,
-        created_by=body.created_by,
+        delta = _TXN_SIGN[txn_type] * abs(body.qty)
+        new_qty = InventoryLot.qty_on_hand + delta
+        if delta < 0:
+            stmt = stmt.where(InventoryLot.qty_on_hand >= -delta)
+
+    # The lot UPDATE runs as a data-modifying CTE and the transaction row is
+    # inserted from its RETURNING, so both happen in one statement and no
+    # transaction is recorded when the guard rejects the update.
+    updated = (
+        stmt.values(qty_on_hand=new_qty)
+        .returning(InventoryLot.id)
+        .cte("updated_lot")
     )
-    db.add(txn)
-    db.commit()
-    db.refresh(txn)
+    values = {
+        "txn_type": txn_type.value,
+        "qty": body.qty,
+        "from_node_id": body.from_node_id,
+        "to_node_id": body.to_node_id,
+        "reference_type": body.reference_type,
+        "reference_id": body.reference_id,
+        "notes": body.notes,
+        "created_by": body.created_by,
+    }
+    txn = (await db.execute(
+        insert(InventoryTransaction)
+        .add_cte(updated)
+        .from_select(
+            ["lot_id", *values],
+            select(
+                updated.c.id,
+                *(literal(v, InventoryTransaction.__table__.c[k].type) for k, v in values.items()),
+            ),
+        )
+        .returning(*InventoryTransaction.__table__.columns)
+    )).mappings().one_or_none()
+    if txn is None:
+        if await db.get(InventoryLot, body.lot_id) is None:
+            raise HTTPException(status_code=404, detail="Lot not found")
+        raise HTTPException(status_code=400, detail="Insufficient inventory for this transaction")
+    await db.commit()
+    invalidate_positions()
     return txn
 
 
 @router.get("/inventory/transactions", response_model=list[TransactionOut])
-def list_transactions(
+async def list_transactions(
     study_id: UUID | None = Query(None),
     lot_id: UUID | None = Query(None),
     txn_type: str | None = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    after: str | None = Query(None, description=f"Keyset cursor from a previous page's {NEXT_CURSOR_HEADER} header"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = select(InventoryTransaction)
+    # Plain column rows: the lot/node joins only filter, nothing is hydrated
+    q = select(*InventoryTransaction.__table__.columns)
     if study_id:
-        q = q.join(InventoryLot).join(InventoryNode).where(InventoryNode.study_id == study_id)
+        q = (
+            q.join(InventoryLot, InventoryTransaction.lot_id == InventoryLot.id)
+            .join(InventoryNode, InventoryLot.node_id == InventoryNode.id)
+            .where(InventoryNode.study_id == study_id)
+        )
     if lot_id:
         q = q.where(InventoryTransaction.lot_id == lot_id)
     if txn_type:
         q = q.where(InventoryTransaction.txn_type == txn_type.upper())
-    q = q.order_by(InventoryTransaction.created_at.desc()).offset(skip).limit(limit)
-    return db.execute(q).scalars().all()
+    if after:
+        # Newest first over (created_at, id); id breaks created_at ties
+        after_created, after_id = decode_cursor(after, 2)
+        q = q.where(
+            tuple_(InventoryTransaction.created_at, InventoryTransaction.id) < tuple_(after_created, after_id)
+        )
+    else:
+        q = q.offset(skip)
+    q = q.order_by(InventoryTransaction.created_at.desc(), InventoryTransaction.id.desc()).limit(limit)
+    txns = (await db.execute(q)).mappings().all()
+    headers = {}
+    if len(txns) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(txns[-1]["created_at"], txns[-1]["id"])
+    return list_response(TransactionOut, txns, headers)
 
 
 # ---------------------------------------------------------------------------
@@ -332,52 +420,39 @@ def list_transactions(
 # ---------------------------------------------------------------------------
 
 
+# Built once at import; the endpoint only adds filters
+_POSITIONS = select(*(c for c in inventory_positions_mv.c if c.key != "study_id"))
+
+
 @router.get("/inventory/positions", response_model=list[InventoryPosition])
-def list_positions(
+async def list_positions(
     study_id: UUID | None = Query(None),
     node_id: str | None = Query(None),
     product_id: str | None = Query(None),
-    db: Session = Depends(get_db),
+    no_cache: bool = Query(False, description="Bypass the positions cache"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = (
-        select(
-            InventoryNode.node_id,
-            InventoryNode.name.label("node_name"),
-            InventoryLot.product_id,
-            InventoryLot.presentation_id,
-            func.sum(InventoryLot.qty_on_hand).label("total_qty"),
-            func.count(InventoryLot.id).label("lot_count"),
-            func.min(InventoryLot.expiry_date).label("earliest_expiry"),
-        )
-        .join(InventoryLot, InventoryNode.id == InventoryLot.node_id)
-        .where(InventoryLot.status == "RELEASED")
-        .group_by(
-            InventoryNode.node_id,
-            InventoryNode.name,
-            InventoryLot.product_id,
-            InventoryLot.presentation_id,
-        )
-    )
+    cache_key = (study_id, node_id, product_id)
+    if not no_cache:
+        cached = positions_cache.get(cache_key)
+        if cached is not None:
+            return list_response(InventoryPosition, cached)
+    # Captured before the read: a refresh finishing meanwhile bumps it, and
+    # the pre-refresh result is then not cached
+    generation = positions_cache.generation
+
+    mv = inventory_positions_mv
+    q = _POSITIONS
     if study_id:
-        q = q.where(InventoryNode.study_id == study_id)
+        q = q.where(mv.c.study_id == study_id)
     if node_id:
-        q = q.where(InventoryNode.node_id == node_id)
+        q = q.where(mv.c.node_id == node_id)
     if product_id:
-        q = q.where(InventoryLot.product_id == product_id)
+        q = q.where(mv.c.product_id == product_id)
 
-    rows = db.execute(q).all()
-    return [
-        InventoryPosition(
-            node_id=r.node_id,
-            node_name=r.node_name,
-            product_id=r.product_id,
-            presentation_id=r.presentation_id,
-            total_qty=r.total_qty,
-            lot_count=r.lot_count,
-            earliest_expiry=r.earliest_expiry,
-        )
-        for r in rows
-    ]
+    positions = (await db.execute(q)).mappings().all()
+    positions_cache.set(cache_key, positions, generation)
+    return list_response(InventoryPosition, positions)
 
 
 # ---------------------------------------------------------------------------
@@ -394,57 +469,77 @@ class BulkLotsUpload(BaseModel):
 
 
 @router.post("/inventory/nodes/bulk", response_model=list[NodeOut])
-def bulk_create_nodes(body: BulkNodesUpload, db: Session = Depends(get_db)):
-    created = []
+async def bulk_create_nodes(body: BulkNodesUpload, db: AsyncSession = Depends(get_async_db)):
+    existing = set(await db.scalars(
+        select(InventoryNode.node_id).where(InventoryNode.node_id.in_({n.node_id for n in body.nodes}))
+    ))
+    rows = []
     for node_data in body.nodes:
-        existing = db.execute(
-            select(InventoryNode).where(InventoryNode.node_id == node_data.node_id)
-        ).scalar_one_or_none()
-        if existing:
+        if node_data.node_id in existing:
             continue  # skip existing nodes
-        node = InventoryNode(
-            node_id=node_data.node_id,
-            node_type=node_data.node_type,
-            name=node_data.name,
-            country=node_data.country,
-            study_id=node_data.study_id,
-            attributes=node_data.attributes,
-        )
-        db.add(node)
-        created.append(node)
-    db.commit()
-    for node in created:
-        db.refresh(node)
+        existing.add(node_data.node_id)
+        rows.append({
+            "node_id": node_data.node_id,
+            "node_type": node_data.node_type,
+            "name": node_data.name,
+            "country": node_data.country,
+            "study_id": node_data.study_id,
+            "attributes": node_data.attributes,
+        })
+    if not rows:
+        return []
+    # RETURNING plain rows: they carry every NodeOut column and, unlike ORM
+    # instances, are not expired by the commit, so nothing is re-selected.
+    created = (await db.execute(
+        insert(InventoryNode).returning(*InventoryNode.__table__.columns, sort_by_parameter_order=True),
+        rows,
+    )).mappings().all()
+    await db.commit()
     return created
 
 
 @router.post("/inventory/lots/bulk", response_model=list[LotOut])
-def bulk_create_lots(body: BulkLotsUpload, db: Session = Depends(get_db)):
-    created = []
-    for lot_data in body.lots:
-        node = _resolve_node(db, lot_data.node_id)
-        lot = InventoryLot(
-            node_id=node.id,
-            product_id=lot_data.product_id,
-            presentation_id=lot_data.presentation_id,
-            lot_number=lot_data.lot_number,
-            expiry_date=lot_data.expiry_date,
-            status=lot_data.status.upper(),
-            qty_on_hand=lot_data.qty_on_hand,
+async def bulk_create_lots(body: BulkLotsUpload, db: AsyncSession = Depends(get_async_db)):
+    if not body.lots:
+        return []
+    node_ids = {lot_data.node_id for lot_data in body.lots}
+    node_map = dict((await db.execute(
+        select(InventoryNode.node_id, InventoryNode.id).where(InventoryNode.node_id.in_(node_ids))
+    )).all())
+    missing = node_ids - node_map.keys()
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Nodes not found: {', '.join(repr(n) for n in sorted(missing))}",
         )
-        db.add(lot)
-        db.flush()  # get lot.id
-        # If vials provided, add them
-        if lot_data.vials:
-            for vial_data in lot_data.vials:
-                vial = InventoryVial(
-                    lot_id=lot.id,
-                    medication_number=vial_data.medication_number,
-                    status=vial_data.status,
-                )
-                db.add(vial)
-        created.append(lot)
-    db.commit()
-    for lot in created:
-        db.refresh(lot)
+
+    # One multi-row INSERT for the lots; RETURNING (in payload order) supplies
+    # the ids the vials need and the response rows, so there is no per-lot
+    # flush and no refresh after commit.
+    created = (await db.execute(
+        insert(InventoryLot).returning(*InventoryLot.__table__.columns, sort_by_parameter_order=True),
+        [
+            {
+                "node_id": node_map[lot_data.node_id],
+                "product_id": lot_data.product_id,
+                "presentation_id": lot_data.presentation_id,
+                "lot_number": lot_data.lot_number,
+                "expiry_date": lot_data.expiry_date,
+                "status": lot_data.status.upper(),
+                "qty_on_hand": lot_data.qty_on_hand,
+            }
+            for lot_data in body.lots
+        ],
+    )).mappings().all()
+    await async_bulk_insert(
+        db,
+        InventoryVial,
+        [
+            {"lot_id": lot["id"], "medication_number": vial_data.medication_number, "status": vial_data.status}
+            for lot, lot_data in zip(created, body.lots)
+            for vial_data in lot_data.vials or []
+        ],
+    )
+    await db.commit()
+    invalidate_positions()
     return created
@@ -11,15 +11,17 @@ from __future__ import annotations
 
 import csv
 import io
-from datetime import UTC, datetime
+from collections.abc import AsyncIterator, Iterable, Sequence
+from datetime import UTC, datetime, timedelta
+from itertools import chain, islice, repeat
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
-from sqlalchemy import case, func, select
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, Float, Integer, Numeric, Select, bindparam, case, cast, func, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_db
+from app.db.session import AsyncSessionLocal, get_async_db
 from app.models.inventory import InventoryLot, InventoryNode, InventoryTransaction
 from app.models.scenario import ForecastRun
 from app.models.subject import KitAssignment, Subject, SubjectVisit
@@ -27,15 +29,60 @@ from app.models.subject import KitAssignment, Subject, SubjectVisit
 router = APIRouter()
 
 
-def _csv_response(rows: list[list], headers: list[str], filename: str) -> StreamingResponse:
-    """Create a streaming CSV response."""
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(headers)
-    writer.writerows(rows)
-    buf.seek(0)
+CSV_CHUNK_SIZE = 64 * 1024
+
+
+def _iso(col):
+    """Render a timestamptz column as ISO 8601 in UTC (NULL stays NULL)."""
+    return func.to_char(func.timezone("UTC", col), 'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"')
+
+
+def _csv_response(rows: Iterable[Sequence], headers: list[str], filename: str) -> StreamingResponse:
+    """Create a streaming CSV response, sent in chunks as rows are written."""
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            if buf.tell() >= CSV_CHUNK_SIZE:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
     return StreamingResponse(
-        iter([buf.getvalue()]),
+        generate(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def _copy_csv_response(q: Select, filename: str) -> StreamingResponse:
+    """Stream ``q`` as CSV produced by PostgreSQL's ``COPY ... TO STDOUT``.
+
+    Postgres formats every cell and the header line (from the column labels),
+    so rows are never hydrated in Python. The request's session is closed
+    before a streamed body is sent, so the copy runs on a session of its own.
+    Filter values are passed as parameters, which psycopg binds client-side
+    for COPY.
+    """
+
+    async def generate() -> AsyncIterator[bytes]:
+        async with AsyncSessionLocal() as db:
+            conn = await db.connection()
+            compiled = q.compile(dialect=conn.dialect)
+            raw = await conn.get_raw_connection()
+            async with raw.driver_connection.cursor() as cursor:
+                async with cursor.copy(
+                    f"COPY ({compiled}) TO STDOUT WITH (FORMAT csv, HEADER)", compiled.params,
+                ) as copy:
+                    async for chunk in copy:
+                        yield bytes(chunk)
+
+    return StreamingResponse(
+        generate(),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
@@ -46,53 +93,39 @@ def _csv_response(rows: list[list], headers: list[str], filename: str) -> Stream
 # ---------------------------------------------------------------------------
 
 
+# Report statements are built once at import; endpoints only add filters.
+_INVENTORY_EXPORT = (
+    select(
+        InventoryNode.node_id,
+        InventoryNode.name.label("node_name"),
+        InventoryNode.node_type,
+        InventoryLot.product_id,
+        InventoryLot.presentation_id,
+        InventoryLot.lot_number,
+        _iso(InventoryLot.expiry_date).label("expiry_date"),
+        InventoryLot.status,
+        InventoryLot.qty_on_hand,
+        _iso(InventoryLot.updated_at).label("last_updated"),
+    )
+    .join(InventoryLot, InventoryNode.id == InventoryLot.node_id)
+)
+
+
 @router.get("/reports/inventory/csv")
-def export_inventory_csv(
+async def export_inventory_csv(
     node_id: str | None = Query(None),
     status: str | None = Query(None),
-    db: Session = Depends(get_db),
 ):
     """Export current inventory as CSV."""
-    q = (
-        select(
-            InventoryNode.node_id,
-            InventoryNode.name,
-            InventoryNode.node_type,
-            InventoryLot.product_id,
-            InventoryLot.presentation_id,
-            InventoryLot.lot_number,
-            InventoryLot.expiry_date,
-            InventoryLot.status,
-            InventoryLot.qty_on_hand,
-            InventoryLot.updated_at,
-        )
-        .join(InventoryLot, InventoryNode.id == InventoryLot.node_id)
-    )
+    q = _INVENTORY_EXPORT
     if node_id:
         q = q.where(InventoryNode.node_id == node_id)
     if status:
         q = q.where(InventoryLot.status == status.upper())
     q = q.order_by(InventoryNode.node_id, InventoryLot.product_id, InventoryLot.expiry_date)
 
-    rows = db.execute(q).all()
-
-    headers = [
-        "node_id", "node_name", "node_type", "product_id", "presentation_id",
-        "lot_number", "expiry_date", "status", "qty_on_hand", "last_updated",
-    ]
-    data = [
-        [
-            r.node_id, r.name, r.node_type, r.product_id, r.presentation_id,
-            r.lot_number,
-            r.expiry_date.isoformat() if r.expiry_date else "",
-            r.status, r.qty_on_hand,
-            r.updated_at.isoformat() if r.updated_at else "",
-        ]
-        for r in rows
-    ]
-
     ts = datetime.now(UTC).strftime("%Y%m%d_%H%M%S")
-    return _csv_response(data, headers, f"inventory_{ts}.csv")
+    return _copy_csv_response(q, f"inventory_{ts}.csv")
 
 
 # ---------------------------------------------------------------------------
@@ -101,9 +134,9 @@ def export_inventory_csv(
 
 
 @router.get("/reports/forecast/{forecast_run_id}/csv")
-def export_forecast_csv(forecast_run_id: UUID, db: Session = Depends(get_db)):
+async def export_forecast_csv(forecast_run_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Export forecast demand as CSV (one row per SKU per bucket)."""
-    fr = db.get(ForecastRun, forecast_run_id)
+    fr = await db.get(ForecastRun, forecast_run_id)
     if not fr:
         raise HTTPException(status_code=404, detail="ForecastRun not found")
     if not fr.outputs:
@@ -119,17 +152,12 @@ def export_forecast_csv(forecast_run_id: UUID, db: Session = Depends(get_db)):
     sku_keys = sorted(demand.keys())
     headers.extend([f"demand_{k}" for k in sku_keys])
 
-    rows = []
-    for i, d in enumerate(bucket_dates):
-        row = [
-            i, d,
-            enrolled[i] if i < len(enrolled) else 0,
-            cumulative[i] if i < len(cumulative) else 0,
-        ]
-        for k in sku_keys:
-            vals = demand.get(k, [])
-            row.append(vals[i] if i < len(vals) else 0)
-        rows.append(row)
+    # Pad/trim each series to the bucket count once, then zip columns into
+    # rows instead of bounds-checking every cell.
+    n = len(bucket_dates)
+    series = [enrolled, cumulative, *(demand[k] for k in sku_keys)]
+    columns = [list(islice(chain(vals, repeat(0)), n)) for vals in series]
+    rows = zip(range(n), bucket_dates, *columns)
 
     ts = datetime.now(UTC).strftime("%Y%m%d_%H%M%S")
     return _csv_response(rows, headers, f"forecast_{forecast_run_id}_{ts}.csv")
@@ -140,56 +168,46 @@ def export_forecast_csv(forecast_run_id: UUID, db: Session = Depends(get_db)):
 # ---------------------------------------------------------------------------
 
 
+_CUTOFF = bindparam("cutoff", type_=DateTime(timezone=True))
+_THRESHOLD = bindparam("threshold", type_=DateTime(timezone=True))
+
+_EXPIRY_RISK_EXPORT = (
+    select(
+        InventoryNode.node_id,
+        InventoryNode.name.label("node_name"),
+        InventoryLot.product_id,
+        InventoryLot.presentation_id,
+        InventoryLot.lot_number,
+        _iso(InventoryLot.expiry_date).label("expiry_date"),
+        # Whole days, rounded down like timedelta.days
+        cast(
+            func.floor(func.extract("epoch", InventoryLot.expiry_date - _CUTOFF) / 86400), Integer,
+        ).label("days_until_expiry"),
+        InventoryLot.status,
+        InventoryLot.qty_on_hand,
+    )
+    .join(InventoryLot, InventoryNode.id == InventoryLot.node_id)
+    .where(
+        InventoryLot.status == "RELEASED",
+        InventoryLot.qty_on_hand > 0,
+        InventoryLot.expiry_date.isnot(None),
+        InventoryLot.expiry_date <= _THRESHOLD,
+    )
+    .order_by(InventoryLot.expiry_date.asc())
+)
+
+
 @router.get("/reports/expiry-risk/csv")
-def export_expiry_risk_csv(
+async def export_expiry_risk_csv(
     days_threshold: int = Query(90, description="Flag lots expiring within this many days"),
-    db: Session = Depends(get_db),
 ):
     """Export lots at risk of expiry."""
     cutoff = datetime.now(UTC)
-    from datetime import timedelta
     threshold_date = cutoff + timedelta(days=days_threshold)
 
-    q = (
-        select(
-            InventoryNode.node_id,
-            InventoryNode.name,
-            InventoryLot.product_id,
-            InventoryLot.presentation_id,
-            InventoryLot.lot_number,
-            InventoryLot.expiry_date,
-            InventoryLot.status,
-            InventoryLot.qty_on_hand,
-        )
-        .join(InventoryLot, InventoryNode.id == InventoryLot.node_id)
-        .where(
-            InventoryLot.status == "RELEASED",
-            InventoryLot.qty_on_hand > 0,
-            InventoryLot.expiry_date.isnot(None),
-            InventoryLot.expiry_date <= threshold_date,
-        )
-        .order_by(InventoryLot.expiry_date.asc())
-    )
-
-    rows = db.execute(q).all()
-
-    headers = [
-        "node_id", "node_name", "product_id", "presentation_id",
-        "lot_number", "expiry_date", "days_until_expiry", "status", "qty_on_hand",
-    ]
-    data = []
-    for r in rows:
-        days_left = (r.expiry_date - cutoff).days if r.expiry_date else None
-        data.append([
-            r.node_id, r.name, r.product_id, r.presentation_id,
-            r.lot_number,
-            r.expiry_date.isoformat() if r.expiry_date else "",
-            days_left,
-            r.status, r.qty_on_hand,
-        ])
-
+    q = _EXPIRY_RISK_EXPORT.params(cutoff=cutoff, threshold=threshold_date)
     ts = datetime.now(UTC).strftime("%Y%m%d_%H%M%S")
-    return _csv_response(data, headers, f"expiry_risk_{ts}.csv")
+    return _copy_csv_response(q, f"expiry_risk_{ts}.csv")
 
 
 # ---------------------------------------------------------------------------
@@ -197,61 +215,48 @@ def export_expiry_risk_csv(
 # ---------------------------------------------------------------------------
 
 
-@router.get("/reports/lot-utilization/csv")
-def export_lot_utilization_csv(db: Session = Depends(get_db)):
-    """Export lot utilization: total received, total issued, current on-hand."""
-    # Aggregate transactions by lot
-    q = (
-        select(
-            InventoryNode.node_id,
-            InventoryLot.product_id,
-            InventoryLot.lot_number,
-            InventoryLot.qty_on_hand,
-            InventoryLot.status,
-            func.sum(
-                case(
-                    (InventoryTransaction.txn_type.in_(["RECEIPT", "TRANSFER_IN", "RETURN"]),
-                     InventoryTransaction.qty),
-                    else_=0,
-                )
-            ).label("total_received"),
-            func.sum(
-                case(
-                    (InventoryTransaction.txn_type.in_(["ISSUE", "TRANSFER_OUT"]),
-                     func.abs(InventoryTransaction.qty)),
-                    else_=0,
-                )
-            ).label("total_issued"),
-            func.count(InventoryTransaction.id).label("txn_count"),
-        )
-        .join(InventoryLot, InventoryNode.id == InventoryLot.node_id)
-        .outerjoin(InventoryTransaction, InventoryLot.id == InventoryTransaction.lot_id)
-        .group_by(
-            InventoryNode.node_id,
-            InventoryLot.product_id,
-            InventoryLot.lot_number,
-            InventoryLot.qty_on_hand,
-            InventoryLot.status,
-        )
-        .order_by(InventoryNode.node_id, InventoryLot.product_id)
+# Aggregate transactions by lot
+_LOT_UTILIZATION_EXPORT = (
+    select(
+        InventoryNode.node_id,
+        InventoryLot.product_id,
+        InventoryLot.lot_number,
+        InventoryLot.status,
+        InventoryLot.qty_on_hand,
+        func.coalesce(func.sum(
+            case(
+                (InventoryTransaction.txn_type.in_(["RECEIPT", "TRANSFER_IN", "RETURN"]),
+                 InventoryTransaction.qty),
+                else_=0,
+            )
+        ), 0).label("total_received"),
+        func.coalesce(func.sum(
+            case(
+                (InventoryTransaction.txn_type.in_(["ISSUE", "TRANSFER_OUT"]),
+                 func.abs(InventoryTransaction.qty)),
+                else_=0,
+            )
+        ), 0).label("total_issued"),
+        func.count(InventoryTransaction.id).label("txn_count"),
     )
+    .join(InventoryLot, InventoryNode.id == InventoryLot.node_id)
+    .outerjoin(InventoryTransaction, InventoryLot.id == InventoryTransaction.lot_id)
+    .group_by(
+        InventoryNode.node_id,
+        InventoryLot.product_id,
+        InventoryLot.lot_number,
+        InventoryLot.qty_on_hand,
+        InventoryLot.status,
+    )
+    .order_by(InventoryNode.node_id, InventoryLot.product_id)
+)
 
-    rows = db.execute(q).all()
-
-    headers = [
-        "node_id", "product_id", "lot_number", "status",
-        "qty_on_hand", "total_received", "total_issued", "txn_count",
-    ]
-    data = [
-        [
-            r.node_id, r.product_id, r.lot_number, r.status,
-            r.qty_on_hand, float(r.total_received or 0), float(r.total_issued or 0), r.txn_count,
-        ]
-        for r in rows
-    ]
 
+@router.get("/reports/lot-utilization/csv")
+async def export_lot_utilization_csv():
+    """Export lot utilization: total received, total issued, current on-hand."""
     ts = datetime.now(UTC).strftime("%Y%m%d_%H%M%S")
-    return _csv_response(data, headers, f"lot_utilization_{ts}.csv")
+    return _copy_csv_response(_LOT_UTILIZATION_EXPORT, f"lot_utilization_{ts}.csv")
 
 
 # ---------------------------------------------------------------------------
@@ -260,46 +265,69 @@ def export_lot_utilization_csv(db: Session = Depends(get_db)):
 
 
 @router.get("/reports/forecast-vs-actual/csv")
-def export_forecast_vs_actual_csv(
+async def export_forecast_vs_actual_csv(
     forecast_run_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Compare forecasted demand vs actual dispensed quantities.
 
     Actuals are derived from KitAssignment records.
     """
-    fr = db.get(ForecastRun, forecast_run_id)
-    if not fr or not fr.outputs:
+    found = await db.scalar(
+        select(ForecastRun.id).where(
+            ForecastRun.id == forecast_run_id,
+            func.jsonb_typeof(ForecastRun.outputs) == "object",
+            ForecastRun.outputs != {},
+        )
+    )
+    if found is None:
         raise HTTPException(status_code=404, detail="ForecastRun not found or has no outputs")
 
-    outputs = fr.outputs
-    bucket_dates = outputs.get("bucket_dates", [])
-    demand = outputs.get("demand", {})
+    # Forecast totals per SKU, summed from the run's demand JSON in place
+    demand = func.jsonb_each(ForecastRun.outputs["demand"]).table_valued("key", "value", name="demand")
+    bucket = func.jsonb_array_elements_text(demand.c.value).table_valued("value", name="bucket")
+    forecasts = (
+        select(
+            demand.c.key.label("sku"),
+            func.coalesce(func.sum(cast(bucket.c.value, Float)), 0).label("forecasted"),
+        )
+        .select_from(ForecastRun)
+        .join(demand, true())
+        .outerjoin(bucket, true())
+        .where(ForecastRun.id == forecast_run_id)
+        .group_by(demand.c.key)
+        .cte("forecasts")
+    )
 
-    # Get actual dispenses grouped by product
-    actuals_q = (
+    # Actual dispenses, keyed the way forecast SKUs are ("product[:presentation]")
+    sku = case(
+        (func.coalesce(KitAssignment.presentation_id, "") != "",
+         KitAssignment.product_id + ":" + KitAssignment.presentation_id),
+        else_=KitAssignment.product_id,
+    )
+    actuals = (
+        select(sku.label("sku"), func.sum(KitAssignment.qty_dispensed).label("dispensed"))
+        .group_by(sku)
+        .cte("actuals")
+    )
+
+    forecasted = forecasts.c.forecasted
+    actual = func.coalesce(actuals.c.dispensed, 0)
+    variance = actual - forecasted
+    q = (
         select(
-            KitAssignment.product_id,
-            KitAssignment.presentation_id,
-            func.sum(KitAssignment.qty_dispensed).label("total_dispensed"),
+            forecasts.c.sku,
+            func.round(cast(forecasted, Numeric), 2).label("total_forecasted"),
+            func.round(cast(actual, Numeric), 2).label("total_actual"),
+            func.round(cast(variance, Numeric), 2).label("variance"),
+            case(
+                (forecasted > 0, func.round(cast(variance / forecasted * 100, Numeric), 1)),
+                else_=0,
+            ).label("variance_pct"),
         )
-        .group_by(KitAssignment.product_id, KitAssignment.presentation_id)
+        .outerjoin(actuals, actuals.c.sku == forecasts.c.sku)
+        .order_by(forecasts.c.sku)
     )
-    actuals = db.execute(actuals_q).all()
-
-    actual_map = {}
-    for r in actuals:
-        key = f"{r.product_id}:{r.presentation_id}" if r.presentation_id else r.product_id
-        actual_map[key] = float(r.total_dispensed or 0)
-
-    headers = ["sku", "total_forecasted", "total_actual", "variance", "variance_pct"]
-    data = []
-    for sku, vals in demand.items():
-        forecasted = sum(vals)
-        actual = actual_map.get(sku, 0)
-        variance = actual - forecasted
-        variance_pct = (variance / forecasted * 100) if forecasted > 0 else 0
-        data.append([sku, round(forecasted, 2), round(actual, 2), round(variance, 2), round(variance_pct, 1)])
 
     ts = datetime.now(UTC).strftime("%Y%m%d_%H%M%S")
-    return _csv_response(data, headers, f"forecast_vs_actual_{ts}.csv")
+    return _copy_csv_response(q, f"forecast_vs_actual_{ts}.csv")
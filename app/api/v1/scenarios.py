@@ -4,12 +4,13 @@ from datetime import UTC, datetime
 from typing import Any
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import func, select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import Text, cast, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import subjects_cache
 from app.core.hashing import stable_hash
-from app.db.session import get_db
+from app.db.session import get_async_db
 from app.models.scenario import Scenario, ScenarioVersion
 from app.models.study import Study
 from app.schemas.canonical import CanonicalScenarioInput
@@ -24,33 +25,64 @@ from app.schemas.scenarios import (
 
 router = APIRouter()
 
+# ScenarioVersionOut's columns: everything but the (large) payload
+_VERSION_OUT_COLUMNS = [c for c in ScenarioVersion.__table__.c if c.key != "payload"]
+
 
 def _merge_patch(base: Any, patch: Any) -> Any:
-    """JSON Merge Patch-like behavior."""
+    """JSON Merge Patch-like behavior.
+
+    Walks nested objects with an explicit stack; only the dicts on patched
+    paths are copied, so ``base`` is never mutated.
+    """
     if not isinstance(patch, dict):
         return patch
 
-    if not isinstance(base, dict):
-        base = {}
-
-    result = dict(base)
-
-    for k, v in patch.items():
-        if v is None:
-            result.pop(k, None)
-        else:
-            if isinstance(v, dict):
-                result[k] = _merge_patch(result.get(k), v)
+    result = dict(base) if isinstance(base, dict) else {}
+    stack = [(result, patch)]
+    while stack:
+        dst, src = stack.pop()
+        for k, v in src.items():
+            if v is None:
+                dst.pop(k, None)
+            elif isinstance(v, dict):
+                child = dst.get(k)
+                child = dict(child) if isinstance(child, dict) else {}
+                dst[k] = child
+                stack.append((child, v))
             else:
-                result[k] = v
+                dst[k] = v
 
     return result
 
 
+async def _insert_next_version(db: AsyncSession, scenario_id: UUID, **values: Any):
+    """Insert a version numbered one past the scenario's latest, in one statement.
+
+    Callers hold a lock on the scenario row, taken in an earlier statement so
+    the max() here sees any version committed while waiting for it.
+    """
+    next_version = (
+        select(func.coalesce(func.max(ScenarioVersion.version), 0) + 1)
+        .where(ScenarioVersion.scenario_id == scenario_id)
+        .scalar_subquery()
+    )
+    values["scenario_id"] = scenario_id
+    row = select(
+        next_version,
+        *(literal(v, ScenarioVersion.__table__.c[k].type) for k, v in values.items()),
+    )
+    return (await db.execute(
+        insert(ScenarioVersion)
+        .from_select(["version", *values], row)
+        .returning(*_VERSION_OUT_COLUMNS)
+    )).mappings().one()
+
+
 @router.post("/scenarios", response_model=ScenarioOut)
-def create_scenario(payload: ScenarioCreate, db: Session = Depends(get_db)):
+async def create_scenario(payload: ScenarioCreate, db: AsyncSession = Depends(get_async_db)):
     if payload.study_id:
-        study = db.get(Study, payload.study_id)
+        study = await db.get(Study, payload.study_id)
         if not study:
             raise HTTPException(status_code=404, detail="Study not found")
 
@@ -62,49 +94,47 @@ def create_scenario(payload: ScenarioCreate, db: Session = Depends(get_db)):
         created_at=datetime.now(UTC),
     )
     db.add(scenario)
-    db.commit()
-    db.refresh(scenario)
+    await db.commit()
+    await db.refresh(scenario)
     return scenario
 
 
 @router.get("/scenarios", response_model=list[ScenarioOut])
-def list_scenarios(
+async def list_scenarios(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
     study_id: UUID | None = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     stmt = select(Scenario)
     if study_id is not None:
         stmt = stmt.where(Scenario.study_id == study_id)
-    rows = (
-        db.execute(
-            stmt
-            .order_by(Scenario.created_at.desc())
-            .offset(skip)
-            .limit(limit)
-        )
-        .scalars()
-        .all()
+    rows = await db.scalars(
+        stmt
+        .order_by(Scenario.created_at.desc())
+        .offset(skip)
+        .limit(limit)
     )
-    return rows
+    return rows.all()
 
 
 @router.get("/scenarios/{scenario_id}", response_model=ScenarioOut)
-def get_scenario(scenario_id: UUID, db: Session = Depends(get_db)):
-    scenario = db.get(Scenario, scenario_id)
+async def get_scenario(scenario_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    scenario = await db.get(Scenario, scenario_id)
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
     return scenario
 
 
 @router.delete("/scenarios/{scenario_id}")
-def delete_scenario(scenario_id: UUID, db: Session = Depends(get_db)):
-    scenario = db.get(Scenario, scenario_id)
+async def delete_scenario(scenario_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    scenario = await db.get(Scenario, scenario_id)
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
-    db.delete(scenario)
-    db.commit()
+    await db.delete(scenario)
+    await db.commit()
+    # The delete cascades to the scenario's subjects, visits and kits
+    subjects_cache.clear()
     return {"detail": "Scenario deleted"}
 
 
@@ -165,34 +195,39 @@ def _merge_study_into_payload(study: Study, payload_dict: dict) -> dict:
 
     if dose_schedule and isinstance(dose_schedule, dict) and payload_dict.get("regimens"):
         cohorts_ds = dose_schedule.get("cohorts", {})
-        # Build cohort→regimen reverse map
+        # Build regimen→cohort reverse map; the first cohort mapped to a regimen wins
         sd = payload_dict.get("study_design") or {}
-        cohort_to_regimen = sd.get("cohort_to_regimen", {})
+        regimen_to_cohort: dict = {}
+        for cid, rid in sd.get("cohort_to_regimen", {}).items():
+            regimen_to_cohort.setdefault(rid, cid)
 
         for regimen in payload_dict["regimens"]:
             existing_rule = regimen.get("dose_rule") or {}
             if existing_rule and existing_rule.get("rows"):
                 continue  # Don't overwrite existing dose_rule rows
 
-            # Find matching cohort via cohort_to_regimen mapping
-            matched_cohort_id = None
-            for cid, rid in cohort_to_regimen.items():
-                if rid == regimen.get("regimen_id"):
-                    matched_cohort_id = cid
-                    break
+            matched_cohort_id = regimen_to_cohort.get(regimen.get("regimen_id"))
 
             if matched_cohort_id and matched_cohort_id in cohorts_ds:
                 cohort_visits = cohorts_ds[matched_cohort_id].get("visits", {})
-                rows = []
-                for visit_id, dose_info in cohort_visits.items():
-                    row: dict = {"visit_id": visit_id}
-                    if dosing_strategy == "fixed":
-                        row["dose_value"] = dose_info.get("dose_value")
-                        row["dose_uom"] = dose_info.get("dose_uom", "mg")
-                    else:
-                        row["per_kg_value"] = dose_info.get("dose_per_kg")
-                        row["per_kg_uom"] = dose_info.get("dose_uom", "ng_per_kg")
-                    rows.append(row)
+                if dosing_strategy == "fixed":
+                    rows = [
+                        {
+                            "visit_id": visit_id,
+                            "dose_value": dose_info.get("dose_value"),
+                            "dose_uom": dose_info.get("dose_uom", "mg"),
+                        }
+                        for visit_id, dose_info in cohort_visits.items()
+                    ]
+                else:
+                    rows = [
+                        {
+                            "visit_id": visit_id,
+                            "per_kg_value": dose_info.get("dose_per_kg"),
+                            "per_kg_uom": dose_info.get("dose_uom", "ng_per_kg"),
+                        }
+                        for visit_id, dose_info in cohort_visits.items()
+                    ]
                 if rows:
                     regimen["dose_rule"] = {
                         "type": "table",
@@ -203,8 +238,15 @@ def _merge_study_into_payload(study: Study, payload_dict: dict) -> dict:
 
 
 @router.post("/scenarios/{scenario_id}/versions", response_model=ScenarioVersionOut)
-def create_version(scenario_id: UUID, body: ScenarioVersionCreate, db: Session = Depends(get_db)):
-    scenario = db.get(Scenario, scenario_id)
+async def create_version(
+    scenario_id: UUID,
+    body: ScenarioVersionCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Save a new version: 201 when one is created, 200 when the latest
+    version already has this payload and label and is returned as-is."""
+    scenario = await db.get(Scenario, scenario_id, with_for_update=True)
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
 
@@ -214,61 +256,67 @@ def create_version(scenario_id: UUID, body: ScenarioVersionCreate, db: Session =
 
     # If scenario is linked to a study, merge study data into version payload
     if scenario.study_id:
-        study = db.get(Study, scenario.study_id)
+        study = await db.get(Study, scenario.study_id)
         if study:
             payload_dict = _merge_study_into_payload(study, payload_dict)
 
-    max_v = db.execute(
-        select(func.max(ScenarioVersion.version)).where(ScenarioVersion.scenario_id == scenario_id)
-    ).scalar_one()
-    next_version = 1 if max_v is None else int(max_v) + 1
-
     payload_hash = stable_hash(payload_dict)
 
-    sv = ScenarioVersion(
-        scenario_id=scenario_id,
-        version=next_version,
+    # Saving an unchanged payload and label returns the latest version
+    # instead of numbering a duplicate. Only the latest counts: re-submitting
+    # an older payload is a revert and still gets a new version.
+    latest = (await db.execute(
+        select(*_VERSION_OUT_COLUMNS)
+        .where(ScenarioVersion.scenario_id == scenario_id)
+        .order_by(ScenarioVersion.version.desc())
+        .limit(1)
+    )).mappings().one_or_none()
+    if (
+        latest is not None
+        and latest["payload_hash"] == payload_hash
+        and latest["label"] == body.label
+    ):
+        return latest
+
+    sv = await _insert_next_version(
+        db,
+        scenario_id,
         label=body.label,
         created_by=body.created_by,
         created_at=datetime.now(UTC),
         payload=payload_dict,
         payload_hash=payload_hash,
     )
-    db.add(sv)
-    db.commit()
-    db.refresh(sv)
+    await db.commit()
+    response.status_code = 201
     return sv
 
 
 @router.get("/scenarios/{scenario_id}/versions", response_model=list[ScenarioVersionOut])
-def list_versions(
+async def list_versions(
     scenario_id: UUID,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    rows = (
-        db.execute(
-            select(ScenarioVersion)
-            .where(ScenarioVersion.scenario_id == scenario_id)
-            .order_by(ScenarioVersion.version.asc())
-            .offset(skip)
-            .limit(limit)
-        )
-        .scalars()
-        .all()
+    rows = await db.scalars(
+        select(ScenarioVersion)
+        .where(ScenarioVersion.scenario_id == scenario_id)
+        .order_by(ScenarioVersion.version.asc())
+        .offset(skip)
+        .limit(limit)
     )
-    return rows
+    return rows.all()
 
 
 @router.get("/scenarios/{scenario_id}/versions/latest", response_model=ScenarioVersionDetailOut)
-def get_latest_version(scenario_id: UUID, db: Session = Depends(get_db)):
-    sv = db.execute(
+async def get_latest_version(scenario_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    sv = (await db.execute(
         select(ScenarioVersion)
         .where(ScenarioVersion.scenario_id == scenario_id)
         .order_by(ScenarioVersion.version.desc())
         .limit(1)
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
 
     if not sv:
         raise HTTPException(status_code=404, detail="No versions found for scenario")
@@ -276,11 +324,11 @@ def get_latest_version(scenario_id: UUID, db: Session = Depends(get_db)):
 
 
 @router.get("/scenarios/{scenario_id}/versions/{version}", response_model=ScenarioVersionDetailOut)
-def get_version(scenario_id: UUID, version: int, db: Session = Depends(get_db)):
-    sv = db.execute(
+async def get_version(scenario_id: UUID, version: int, db: AsyncSession = Depends(get_async_db)):
+    sv = (await db.execute(
         select(ScenarioVersion)
         .where(ScenarioVersion.scenario_id == scenario_id, ScenarioVersion.version == version)
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
 
     if not sv:
         raise HTTPException(status_code=404, detail="Scenario version not found")
@@ -288,54 +336,55 @@ def get_version(scenario_id: UUID, version: int, db: Session = Depends(get_db)):
 
 
 @router.get("/scenarios/{scenario_id}/versions/{version}/export")
-def export_version(scenario_id: UUID, version: int, db: Session = Depends(get_db)):
-    sv = db.execute(
-        select(ScenarioVersion)
+async def export_version(scenario_id: UUID, version: int, db: AsyncSession = Depends(get_async_db)):
+    # Postgres renders the JSONB as JSON text, passed through without ever
+    # becoming a Python object
+    payload = (await db.execute(
+        select(cast(ScenarioVersion.payload, Text))
         .where(ScenarioVersion.scenario_id == scenario_id, ScenarioVersion.version == version)
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
 
-    if not sv:
+    if payload is None:
         raise HTTPException(status_code=404, detail="Scenario version not found")
 
-    return sv.payload
+    return Response(content=payload, media_type="application/json")
 
 
 @router.post("/scenarios/{scenario_id}/versions/{version}/fork", response_model=ScenarioVersionOut)
-def fork_version(scenario_id: UUID, version: int, req: ForkRequest, db: Session = Depends(get_db)):
-    base = db.execute(
+async def fork_version(scenario_id: UUID, version: int, req: ForkRequest, db: AsyncSession = Depends(get_async_db)):
+    base = (await db.execute(
         select(ScenarioVersion)
+        .join(ScenarioVersion.scenario)
         .where(ScenarioVersion.scenario_id == scenario_id, ScenarioVersion.version == version)
-    ).scalar_one_or_none()
+        .with_for_update(of=Scenario)
+    )).scalar_one_or_none()
 
     if not base:
         raise HTTPException(status_code=404, detail="Base scenario version not found")
 
-    merged_payload = _merge_patch(base.payload, req.override)
+    if not req.override:
+        # A plain copy: the stored payload and its hash carry over unchanged
+        merged_payload_json = base.payload
+        payload_hash = base.payload_hash
+    else:
+        merged_payload = _merge_patch(base.payload, req.override)
 
-    try:
-        merged_model = CanonicalScenarioInput.model_validate(merged_payload)
-        merged_payload_json = merged_model.model_dump(mode="json")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Override produced invalid canonical payload: {e}")
+        try:
+            merged_model = CanonicalScenarioInput.model_validate(merged_payload)
+            merged_payload_json = merged_model.model_dump(mode="json")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Override produced invalid canonical payload: {e}")
 
-    max_v = db.execute(
-        select(func.max(ScenarioVersion.version)).where(ScenarioVersion.scenario_id == scenario_id)
-    ).scalar_one()
-    next_version = 1 if max_v is None else int(max_v) + 1
+        payload_hash = stable_hash(merged_payload_json)
 
-    payload_hash = stable_hash(merged_payload_json)
-
-    sv = ScenarioVersion(
-        scenario_id=scenario_id,
-        version=next_version,
+    sv = await _insert_next_version(
+        db,
+        scenario_id,
         label=req.label,
         created_by=req.created_by,
         created_at=datetime.now(UTC),
         payload=merged_payload_json,
         payload_hash=payload_hash,
     )
-
-    db.add(sv)
-    db.commit()
-    db.refresh(sv)
+    await db.commit()
     return sv
@@ -1,5 +1,6 @@
 import json
 from datetime import date
+from functools import cache
 
 from fastapi import APIRouter, Query
 from fastapi.responses import Response
@@ -14,29 +15,41 @@ from app.schemas.canonical import (
 router = APIRouter()
 
 
-def _json_response(data: object, pretty: bool) -> object:
-    if not pretty:
-        return data
+def _encode(data: object, pretty: bool) -> bytes:
+    if pretty:
+        return json.dumps(data, indent=2, default=str).encode()
+    # Same encoding FastAPI's JSONResponse would produce
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
 
-    return Response(
-        content=json.dumps(data, indent=2, default=str),
-        media_type="application/json",
-    )
+
+# Both documents are fixed for the life of the process, so each variant is
+# built and encoded once.
+@cache
+def _schema_json(pretty: bool) -> bytes:
+    return _encode(CanonicalScenarioInput.model_json_schema(), pretty)
+
+
+@cache
+def _example_json(pretty: bool) -> bytes:
+    return _encode(_build_example(), pretty)
 
 
 @router.get("/schema/canonical")
 def canonical_schema(
     pretty: bool = Query(False, description="If true, return indented JSON for readability.")
 ):
-    schema = CanonicalScenarioInput.model_json_schema()
-    return _json_response(schema, pretty=pretty)
+    return Response(content=_schema_json(pretty), media_type="application/json")
 
 
 @router.get("/schema/canonical/example")
 def canonical_example(
     pretty: bool = Query(False, description="If true, return indented JSON for readability.")
 ):
-    example = CanonicalScenarioInput(
+    return Response(content=_example_json(pretty), media_type="application/json")
+
+
+def _build_example() -> dict:
+    return CanonicalScenarioInput(
         schema_version="1.0.0",
         trial={
             "code": "EXAMPLE-001",
@@ -114,5 +127,3 @@ def canonical_example(
         starting_inventory=None,
         tags=["example"],
     ).model_dump(mode="json")
-
-    return _json_response(example, pretty=pretty)
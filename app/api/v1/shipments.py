@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-from datetime import UTC, datetime
-from uuid import UUID
+from typing import Any, Iterable
+from uuid import UUID, uuid4
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
-from sqlalchemy.orm import Session, selectinload
-
-from app.db.session import get_db
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.positions import invalidate_positions
+from app.core.responses import list_response
+from app.db.bulk import async_bulk_insert
+from app.db.session import get_async_db
 from app.models.inventory import InventoryLot, InventoryNode, InventoryTransaction
 from app.models.shipment import Shipment, ShipmentItem
 from app.schemas.shipment import ShipmentAction, ShipmentCreate, ShipmentOut
@@ -23,34 +27,93 @@ VALID_TRANSITIONS = {
 }
 
 
-def _resolve_node(db: Session, node_id_str: str) -> InventoryNode:
-    node = db.execute(
-        select(InventoryNode).where(InventoryNode.node_id == node_id_str)
-    ).scalar_one_or_none()
-    if not node:
-        raise HTTPException(status_code=404, detail=f"Node '{node_id_str}' not found")
-    return node
+async def _resolve_node_ids(db: AsyncSession, *node_ids: str) -> dict[str, UUID]:
+    """Map logical node ids to primary keys in one query; 404 on the first unknown one."""
+    found = dict((await db.execute(
+        select(InventoryNode.node_id, InventoryNode.id).where(InventoryNode.node_id.in_(node_ids))
+    )).tuples().all())
+    for node_id_str in node_ids:
+        if node_id_str not in found:
+            raise HTTPException(status_code=404, detail=f"Node '{node_id_str}' not found")
+    return found
 
 
-def _load_shipment(db: Session, shipment_id: UUID) -> Shipment:
-    shipment = db.execute(
+async def _load_shipment(db: AsyncSession, shipment_id: UUID) -> Shipment:
+    # populate_existing: instances outlive commits (expire_on_commit=False), and
+    # items added by shipment_id alone never reach an already-loaded collection
+    shipment = (await db.execute(
         select(Shipment)
         .options(selectinload(Shipment.items))
         .where(Shipment.id == shipment_id)
-    ).scalar_one_or_none()
+        .execution_options(populate_existing=True)
+    )).scalar_one_or_none()
     if not shipment:
         raise HTTPException(status_code=404, detail="Shipment not found")
     return shipment
 
 
+async def _lock_lots(db: AsyncSession, lot_ids: list[UUID]) -> dict[UUID, InventoryLot]:
+    """Load and row-lock the given lots in one query, keyed by id."""
+    lots = await db.scalars(
+        select(InventoryLot)
+        .where(InventoryLot.id.in_(lot_ids))
+        .order_by(InventoryLot.id)  # consistent lock order across requests
+        .with_for_update()
+    )
+    return {lot.id: lot for lot in lots}
+
+
+async def _transition(
+    db: AsyncSession, shipment_id: UUID, allowed_from: Iterable[str], **values: Any,
+) -> str | None:
+    """Apply ``values`` only while the shipment's status is in ``allowed_from``.
+
+    The check and the write are a single UPDATE, so two concurrent actions
+    cannot both pass the gate. Returns None once applied, otherwise the
+    current status; 404 if the shipment does not exist.
+    """
+    applied = (await db.execute(
+        update(Shipment)
+        .where(Shipment.id == shipment_id, Shipment.status.in_(allowed_from))
+        .values(**values)
+        .returning(Shipment.id)
+        .execution_options(synchronize_session=False)
+    )).scalar_one_or_none()
+    if applied is not None:
+        return None
+    current = (await db.execute(
+        select(Shipment.status).where(Shipment.id == shipment_id)
+    )).scalar_one_or_none()
+    if current is None:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    return current
+
+
+async def _advance(db: AsyncSession, shipment_id: UUID, target: str, **values: Any) -> None:
+    """Move the shipment to ``target`` along VALID_TRANSITIONS, or 400."""
+    sources = [status for status, targets in VALID_TRANSITIONS.items() if target in targets]
+    current = await _transition(db, shipment_id, sources, status=target, **values)
+    if current is not None:
+        allowed = VALID_TRANSITIONS.get(current, [])
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot transition from '{current}' to '{target}'. Allowed: {allowed}",
+        )
+
+
+def _note_values(tag: str, notes: str | None) -> dict[str, Any]:
+    if not notes:
+        return {}
+    return {"notes": func.coalesce(Shipment.notes, "") + f"\n[{tag}] {notes}"}
+
+
 @router.post("/shipments", response_model=ShipmentOut)
-def create_shipment(body: ShipmentCreate, db: Session = Depends(get_db)):
-    from_node = _resolve_node(db, body.from_node_id)
-    to_node = _resolve_node(db, body.to_node_id)
+async def create_shipment(body: ShipmentCreate, db: AsyncSession = Depends(get_async_db)):
+    node_ids = await _resolve_node_ids(db, body.from_node_id, body.to_node_id)
 
     shipment = Shipment(
-        from_node_id=from_node.id,
-        to_node_id=to_node.id,
+        from_node_id=node_ids[body.from_node_id],
+        to_node_id=node_ids[body.to_node_id],
         lane_id=body.lane_id,
         temperature_req=body.temperature_req,
         courier=body.courier,
@@ -59,68 +122,67 @@ def create_shipment(body: ShipmentCreate, db: Session = Depends(get_db)):
         status="REQUESTED",
     )
     db.add(shipment)
-    db.flush()  # get shipment.id
+    await db.flush()  # get shipment.id
 
+    known_lots = set(await db.scalars(
+        select(InventoryLot.id).where(InventoryLot.id.in_([item.lot_id for item in body.items]))
+    ))
     for item in body.items:
-        lot = db.get(InventoryLot, item.lot_id)
-        if not lot:
+        if item.lot_id not in known_lots:
             raise HTTPException(status_code=404, detail=f"Lot {item.lot_id} not found")
 
-        si = ShipmentItem(
-            shipment_id=shipment.id,
-            lot_id=item.lot_id,
-            product_id=item.product_id,
-            presentation_id=item.presentation_id,
-            qty=item.qty,
-        )
-        db.add(si)
+    await async_bulk_insert(
+        db,
+        ShipmentItem,
+        [{"shipment_id": shipment.id, **item.model_dump()} for item in body.items],
+    )
 
-    db.commit()
-    db.refresh(shipment)
-    return _load_shipment(db, shipment.id)
+    await db.commit()
+    return await _load_shipment(db, shipment.id)
 
 
 @router.get("/shipments", response_model=list[ShipmentOut])
-def list_shipments(
+async def list_shipments(
     status: str | None = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     q = select(Shipment).options(selectinload(Shipment.items))
     if status:
         q = q.where(Shipment.status == status.upper())
     q = q.order_by(Shipment.requested_at.desc()).offset(skip).limit(limit)
-    return db.execute(q).scalars().unique().all()
+    return list_response(ShipmentOut, (await db.scalars(q)).all())
 
 
 @router.get("/shipments/{shipment_id}", response_model=ShipmentOut)
-def get_shipment(shipment_id: UUID, db: Session = Depends(get_db)):
-    return _load_shipment(db, shipment_id)
+async def get_shipment(shipment_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    return await _load_shipment(db, shipment_id)
 
 
 @router.post("/shipments/{shipment_id}/approve", response_model=ShipmentOut)
-def approve_shipment(shipment_id: UUID, body: ShipmentAction, db: Session = Depends(get_db)):
-    shipment = _load_shipment(db, shipment_id)
-    _assert_transition(shipment, "APPROVED")
-    shipment.status = "APPROVED"
-    shipment.approved_by = body.performed_by
-    shipment.approved_at = datetime.now(UTC)
-    if body.notes:
-        shipment.notes = (shipment.notes or "") + f"\n[APPROVED] {body.notes}"
-    db.commit()
-    return _load_shipment(db, shipment_id)
+async def approve_shipment(shipment_id: UUID, body: ShipmentAction, db: AsyncSession = Depends(get_async_db)):
+    await _advance(
+        db, shipment_id, "APPROVED",
+        approved_by=body.performed_by,
+        approved_at=func.now(),
+        **_note_values("APPROVED", body.notes),
+    )
+    await db.commit()
+    return await _load_shipment(db, shipment_id)
 
 
 @router.post("/shipments/{shipment_id}/pick", response_model=ShipmentOut)
-def pick_shipment(shipment_id: UUID, body: ShipmentAction, db: Session = Depends(get_db)):
+async def pick_shipment(shipment_id: UUID, body: ShipmentAction, db: AsyncSession = Depends(get_async_db)):
     """Mark shipment as picked — issues inventory from source node."""
-    shipment = _load_shipment(db, shipment_id)
-    _assert_transition(shipment, "PICKED")
+    await _advance(db, shipment_id, "PICKED")
+    shipment = await _load_shipment(db, shipment_id)
 
     # Issue inventory from source lots
+    lots = await _lock_lots(db, [item.lot_id for item in shipment.items])
+    txns = []
     for item in shipment.items:
-        lot = db.get(InventoryLot, item.lot_id)
+        lot = lots.get(item.lot_id)
         if not lot:
             raise HTTPException(status_code=400, detail=f"Lot {item.lot_id} no longer exists")
         if lot.qty_on_hand < item.qty:
@@ -129,69 +191,90 @@ def pick_shipment(shipment_id: UUID, body: ShipmentAction, db: Session = Depends
                 detail=f"Insufficient qty for lot {lot.lot_number}: need {item.qty}, have {lot.qty_on_hand}",
             )
         lot.qty_on_hand -= item.qty
-        lot.updated_at = datetime.now(UTC)
-
-        txn = InventoryTransaction(
-            lot_id=item.lot_id,
-            txn_type="TRANSFER_OUT",
-            qty=-item.qty,
-            from_node_id=shipment.from_node_id,
-            to_node_id=shipment.to_node_id,
-            reference_type="SHIPMENT",
-            reference_id=str(shipment.id),
-            created_by=body.performed_by,
-        )
-        db.add(txn)
 
-    shipment.status = "PICKED"
-    db.commit()
-    return _load_shipment(db, shipment_id)
+        txns.append({
+            "lot_id": item.lot_id,
+            "txn_type": "TRANSFER_OUT",
+            "qty": -item.qty,
+            "from_node_id": shipment.from_node_id,
+            "to_node_id": shipment.to_node_id,
+            "reference_type": "SHIPMENT",
+            "reference_id": str(shipment.id),
+            "created_by": body.performed_by,
+        })
+
+    # Flushes the lot decrements, then inserts every transaction at once
+    await async_bulk_insert(db, InventoryTransaction, txns)
+    await db.commit()
+    invalidate_positions()
+    return await _load_shipment(db, shipment_id)
 
 
 @router.post("/shipments/{shipment_id}/ship", response_model=ShipmentOut)
-def ship_shipment(shipment_id: UUID, body: ShipmentAction, db: Session = Depends(get_db)):
-    shipment = _load_shipment(db, shipment_id)
-    _assert_transition(shipment, "SHIPPED")
-    shipment.status = "SHIPPED"
-    shipment.shipped_at = datetime.now(UTC)
+async def ship_shipment(shipment_id: UUID, body: ShipmentAction, db: AsyncSession = Depends(get_async_db)):
+    values: dict[str, Any] = {"shipped_at": func.now()}
     if body.tracking_number:
-        shipment.tracking_number = body.tracking_number
-    db.commit()
-    return _load_shipment(db, shipment_id)
+        values["tracking_number"] = body.tracking_number
+    await _advance(db, shipment_id, "SHIPPED", **values)
+    await db.commit()
+    return await _load_shipment(db, shipment_id)
 
 
 @router.post("/shipments/{shipment_id}/receive", response_model=ShipmentOut)
-def receive_shipment(shipment_id: UUID, body: ShipmentAction, db: Session = Depends(get_db)):
+async def receive_shipment(shipment_id: UUID, body: ShipmentAction, db: AsyncSession = Depends(get_async_db)):
     """Mark shipment as received — creates inventory at destination node."""
-    shipment = _load_shipment(db, shipment_id)
     # Allow receive from SHIPPED or IN_TRANSIT
-    if shipment.status not in ("SHIPPED", "IN_TRANSIT"):
+    current = await _transition(
+        db, shipment_id, ("SHIPPED", "IN_TRANSIT"), status="RECEIVED", received_at=func.now(),
+    )
+    if current is not None:
         raise HTTPException(
             status_code=400,
-            detail=f"Cannot receive from status '{shipment.status}'. Must be SHIPPED or IN_TRANSIT.",
+            detail=f"Cannot receive from status '{current}'. Must be SHIPPED or IN_TRANSIT.",
         )
+    shipment = await _load_shipment(db, shipment_id)
+
+    source_lots = {
+        lot.id: lot
+        for lot in await db.scalars(
+            select(InventoryLot).where(InventoryLot.id.in_([item.lot_id for item in shipment.items]))
+        )
+    }
+    # Lots already at the destination, keyed by (product_id, lot_number)
+    dest_keys = {
+        (item.product_id, source_lots[item.lot_id].lot_number)
+        for item in shipment.items
+        if item.lot_id in source_lots
+    }
+    dest_lots = {
+        (lot.product_id, lot.lot_number): lot
+        for lot in await db.scalars(
+            select(InventoryLot)
+            .where(
+                InventoryLot.node_id == shipment.to_node_id,
+                tuple_(InventoryLot.product_id, InventoryLot.lot_number).in_(list(dest_keys)),
+            )
+            .order_by(InventoryLot.id)
+            .with_for_update()
+        )
+    }
 
     # Create or update lots at destination node
+    txns = []
     for item in shipment.items:
-        source_lot = db.get(InventoryLot, item.lot_id)
+        source_lot = source_lots.get(item.lot_id)
         if not source_lot:
             continue
 
-        # Check if lot already exists at destination
-        dest_lot = db.execute(
-            select(InventoryLot).where(
-                InventoryLot.node_id == shipment.to_node_id,
-                InventoryLot.product_id == item.product_id,
-                InventoryLot.lot_number == source_lot.lot_number,
-            )
-        ).scalar_one_or_none()
-
+        dest_lot = dest_lots.get((item.product_id, source_lot.lot_number))
         if dest_lot:
             dest_lot.qty_on_hand += item.qty
-            dest_lot.updated_at = datetime.now(UTC)
             dest_lot_id = dest_lot.id
         else:
+            # id assigned up front so the transaction row can reference the
+            # lot before it is flushed
             dest_lot = InventoryLot(
+                id=uuid4(),
                 node_id=shipment.to_node_id,
                 product_id=item.product_id,
                 presentation_id=item.presentation_id,
@@ -201,43 +284,38 @@ def receive_shipment(shipment_id: UUID, body: ShipmentAction, db: Session = Depe
                 qty_on_hand=item.qty,
             )
             db.add(dest_lot)
-            db.flush()
             dest_lot_id = dest_lot.id
-
-        txn = InventoryTransaction(
-            lot_id=dest_lot_id,
-            txn_type="TRANSFER_IN",
-            qty=item.qty,
-            from_node_id=shipment.from_node_id,
-            to_node_id=shipment.to_node_id,
-            reference_type="SHIPMENT",
-            reference_id=str(shipment.id),
-            created_by=body.performed_by,
-        )
-        db.add(txn)
-
-    shipment.status = "RECEIVED"
-    shipment.received_at = datetime.now(UTC)
-    db.commit()
-    return _load_shipment(db, shipment_id)
+            # A later item of the same lot adds to this one
+            dest_lots[(item.product_id, source_lot.lot_number)] = dest_lot
+
+        txns.append({
+            "lot_id": dest_lot_id,
+            "txn_type": "TRANSFER_IN",
+            "qty": item.qty,
+            "from_node_id": shipment.from_node_id,
+            "to_node_id": shipment.to_node_id,
+            "reference_type": "SHIPMENT",
+            "reference_id": str(shipment.id),
+            "created_by": body.performed_by,
+        })
+
+    # One flush for the new and updated lots, then the transactions
+    await async_bulk_insert(db, InventoryTransaction, txns)
+    await db.commit()
+    invalidate_positions()
+    return await _load_shipment(db, shipment_id)
 
 
 @router.post("/shipments/{shipment_id}/cancel", response_model=ShipmentOut)
-def cancel_shipment(shipment_id: UUID, body: ShipmentAction, db: Session = Depends(get_db)):
-    shipment = _load_shipment(db, shipment_id)
-    if shipment.status in ("RECEIVED", "CANCELLED"):
-        raise HTTPException(status_code=400, detail=f"Cannot cancel from status '{shipment.status}'")
-    shipment.status = "CANCELLED"
-    if body.notes:
-        shipment.notes = (shipment.notes or "") + f"\n[CANCELLED] {body.notes}"
-    db.commit()
-    return _load_shipment(db, shipment_id)
-
-
-def _assert_transition(shipment: Shipment, target: str) -> None:
-    allowed = VALID_TRANSITIONS.get(shipment.status, [])
-    if target not in allowed:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Cannot transition from '{shipment.status}' to '{target}'. Allowed: {allowed}",
-        )
+async def cancel_shipment(shipment_id: UUID, body: ShipmentAction, db: AsyncSession = Depends(get_async_db)):
+    # Any status short of RECEIVED / CANCELLED, i.e. every VALID_TRANSITIONS key
+    current = await _transition(
+        db, shipment_id, list(VALID_TRANSITIONS),
+        status="CANCELLED",
+        **_note_values("CANCELLED", body.notes),
+    )
+    if current is not None:
+        raise HTTPException(status_code=400, detail=f"Cannot cancel from status '{current}'")
+    await db.commit()
+    return await _load_shipment(db, shipment_id)
+
@@ -4,10 +4,11 @@ from datetime import UTC, datetime
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_db
+from app.db.session import get_async_db
+from app.models.scenario import Scenario
 from app.models.study import Study
 from app.schemas.study import StudyCreate, StudyDetailOut, StudyOut, StudyUpdate
 
@@ -15,7 +16,7 @@ router = APIRouter()
 
 
 @router.post("/studies", response_model=StudyOut)
-def create_study(body: StudyCreate, db: Session = Depends(get_db)):
+async def create_study(body: StudyCreate, db: AsyncSession = Depends(get_async_db)):
     now = datetime.now(UTC)
     study = Study(
         study_code=body.study_code,
@@ -30,44 +31,40 @@ def create_study(body: StudyCreate, db: Session = Depends(get_db)):
     )
     db.add(study)
     try:
-        db.commit()
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=409, detail="Study code already exists")
-    db.refresh(study)
+    await db.refresh(study)
     return study
 
 
 @router.get("/studies", response_model=list[StudyOut])
-def list_studies(
+async def list_studies(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    rows = (
-        db.execute(
-            select(Study)
-            .order_by(Study.created_at.desc())
-            .offset(skip)
-            .limit(limit)
-        )
-        .scalars()
-        .all()
+    rows = await db.scalars(
+        select(Study)
+        .order_by(Study.created_at.desc())
+        .offset(skip)
+        .limit(limit)
     )
-    return rows
+    return rows.all()
 
 
 @router.get("/studies/{study_id}", response_model=StudyDetailOut)
-def get_study(study_id: UUID, db: Session = Depends(get_db)):
-    study = db.get(Study, study_id)
+async def get_study(study_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    study = await db.get(Study, study_id)
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
     return study
 
 
 @router.patch("/studies/{study_id}", response_model=StudyDetailOut)
-def update_study(study_id: UUID, body: StudyUpdate, db: Session = Depends(get_db)):
-    study = db.get(Study, study_id)
+async def update_study(study_id: UUID, body: StudyUpdate, db: AsyncSession = Depends(get_async_db)):
+    study = await db.get(Study, study_id)
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
 
@@ -79,23 +76,24 @@ def update_study(study_id: UUID, body: StudyUpdate, db: Session = Depends(get_db
             setattr(study, field, value)
 
     study.updated_at = datetime.now(UTC)
-    db.commit()
-    db.refresh(study)
+    await db.commit()
+    await db.refresh(study)
     return study
 
 
 @router.delete("/studies/{study_id}")
-def delete_study(study_id: UUID, db: Session = Depends(get_db)):
-    study = db.get(Study, study_id)
+async def delete_study(study_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    study = await db.get(Study, study_id)
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
 
-    if study.scenarios:
+    # Checked with a query: the relationship cannot lazy-load on an AsyncSession
+    if await db.scalar(select(exists().where(Scenario.study_id == study_id))):
         raise HTTPException(
             status_code=409,
             detail="Cannot delete study with linked scenarios. Remove or reassign scenarios first.",
         )
 
-    db.delete(study)
-    db.commit()
+    await db.delete(study)
+    await db.commit()
     return {"detail": "Study deleted"}
@@ -3,11 +3,16 @@ from __future__ import annotations
 from datetime import UTC, datetime
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
-from sqlalchemy.orm import Session, selectinload
-
-from app.db.session import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import subjects_cache
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.core.positions import invalidate_positions
+from app.core.responses import list_json
+from app.db.session import get_async_db
 from app.models.inventory import InventoryLot, InventoryNode, InventoryTransaction
 from app.models.subject import KitAssignment, Subject, SubjectVisit
 from app.schemas.subject import (
@@ -28,76 +33,102 @@ VALID_SUBJECT_STATUSES = {"SCREENED", "ENROLLED", "ACTIVE", "DISCONTINUED", "COM
 VALID_VISIT_STATUSES = {"SCHEDULED", "COMPLETED", "MISSED", "CANCELLED"}
 
 
+def _json(body: bytes, headers: dict[str, str] | None = None) -> Response:
+    return Response(body, media_type="application/json", headers=headers)
+
+
 # ---------------------------------------------------------------------------
 # Subjects
 # ---------------------------------------------------------------------------
 
 
 @router.post("/subjects", response_model=SubjectOut)
-def create_subject(body: SubjectCreate, db: Session = Depends(get_db)):
-    existing = db.execute(
-        select(Subject).where(Subject.subject_number == body.subject_number)
-    ).scalar_one_or_none()
-    if existing:
-        raise HTTPException(status_code=409, detail=f"Subject '{body.subject_number}' already exists")
-
+async def create_subject(body: SubjectCreate, db: AsyncSession = Depends(get_async_db)):
     site_uuid = None
     if body.site_node_id:
-        node = db.execute(
-            select(InventoryNode).where(InventoryNode.node_id == body.site_node_id)
-        ).scalar_one_or_none()
-        if not node:
+        site_uuid = (await db.execute(
+            select(InventoryNode.id).where(InventoryNode.node_id == body.site_node_id)
+        )).scalar_one_or_none()
+        if not site_uuid:
             raise HTTPException(status_code=404, detail=f"Site node '{body.site_node_id}' not found")
-        site_uuid = node.id
-
-    subject = Subject(
-        subject_number=body.subject_number,
-        scenario_id=body.scenario_id,
-        cohort_id=body.cohort_id,
-        arm_id=body.arm_id,
-        site_node_id=site_uuid,
-        status=body.status.upper(),
-        screened_at=body.screened_at or datetime.now(UTC),
-        notes=body.notes,
-        attributes=body.attributes,
-    )
-    db.add(subject)
-    db.commit()
-    db.refresh(subject)
+
+    # The unique subject_number index is the duplicate check: no row back
+    # means it already exists, with no window between check and insert
+    subject = (await db.execute(
+        insert(Subject)
+        .values(
+            subject_number=body.subject_number,
+            scenario_id=body.scenario_id,
+            cohort_id=body.cohort_id,
+            arm_id=body.arm_id,
+            site_node_id=site_uuid,
+            status=body.status.upper(),
+            screened_at=body.screened_at or datetime.now(UTC),
+            notes=body.notes,
+            attributes=body.attributes,
+        )
+        .on_conflict_do_nothing(index_elements=[Subject.subject_number])
+        .returning(*Subject.__table__.columns)
+    )).mappings().one_or_none()
+    if subject is None:
+        raise HTTPException(status_code=409, detail=f"Subject '{body.subject_number}' already exists")
+    await db.commit()
+    subjects_cache.clear()
     return subject
 
 
 @router.get("/subjects", response_model=list[SubjectOut])
-def list_subjects(
+async def list_subjects(
     status: str | None = Query(None),
     cohort_id: str | None = Query(None),
     scenario_id: UUID | None = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    after: str | None = Query(None, description=f"Keyset cursor from a previous page's {NEXT_CURSOR_HEADER} header"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    q = select(Subject)
+    cache_key = ("subjects", status, cohort_id, scenario_id, skip, limit, after)
+    cached = subjects_cache.get(cache_key)
+    if cached is not None:
+        return _json(*cached)
+    generation = subjects_cache.generation
+
+    # Plain rows: SubjectOut is every column, so entity hydration buys nothing
+    q = select(*Subject.__table__.columns)
     if status:
         q = q.where(Subject.status == status.upper())
     if cohort_id:
         q = q.where(Subject.cohort_id == cohort_id)
     if scenario_id:
         q = q.where(Subject.scenario_id == scenario_id)
-    q = q.order_by(Subject.created_at.desc()).offset(skip).limit(limit)
-    return db.execute(q).scalars().all()
+    if after:
+        # Keyset pagination over (created_at, id) DESC: no OFFSET scan for
+        # deep pages. skip is ignored when a cursor is given.
+        after_created, after_id = decode_cursor(after, 2)
+        q = q.where(tuple_(Subject.created_at, Subject.id) < tuple_(after_created, after_id))
+    else:
+        q = q.offset(skip)
+    q = q.order_by(Subject.created_at.desc(), Subject.id.desc()).limit(limit)
+    subjects = (await db.execute(q)).mappings().all()
+    headers = {}
+    if len(subjects) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(subjects[-1]["created_at"], subjects[-1]["id"])
+    body = list_json(SubjectOut, subjects)
+    subjects_cache.set(cache_key, (body, headers), generation)
+    return _json(body, headers)
 
 
 @router.get("/subjects/{subject_id}", response_model=SubjectOut)
-def get_subject(subject_id: UUID, db: Session = Depends(get_db)):
-    subject = db.get(Subject, subject_id)
+async def get_subject(subject_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    subject = await db.get(Subject, subject_id)
     if not subject:
         raise HTTPException(status_code=404, detail="Subject not found")
     return subject
 
 
 @router.patch("/subjects/{subject_id}", response_model=SubjectOut)
-def update_subject(subject_id: UUID, body: SubjectUpdate, db: Session = Depends(get_db)):
-    subject = db.get(Subject, subject_id)
+async def update_subject(subject_id: UUID, body: SubjectUpdate, db: AsyncSession = Depends(get_async_db)):
+    subject = await db.get(Subject, subject_id)
     if not subject:
         raise HTTPException(status_code=404, detail="Subject not found")
 
@@ -118,8 +149,9 @@ def update_subject(subject_id: UUID, body: SubjectUpdate, db: Session = Depends(
         if field in updates:
             setattr(subject, field, updates[field])
 
-    db.commit()
-    db.refresh(subject)
+    await db.commit()
+    subjects_cache.clear()
+    await db.refresh(subject)
     return subject
 
 
@@ -129,37 +161,51 @@ def update_subject(subject_id: UUID, body: SubjectUpdate, db: Session = Depends(
 
 
 @router.post("/subjects/{subject_id}/visits", response_model=SubjectVisitOut)
-def create_visit(subject_id: UUID, body: SubjectVisitCreate, db: Session = Depends(get_db)):
-    subject = db.get(Subject, subject_id)
-    if not subject:
+async def create_visit(subject_id: UUID, body: SubjectVisitCreate, db: AsyncSession = Depends(get_async_db)):
+    values = {
+        "visit_id": body.visit_id,
+        "scheduled_date": body.scheduled_date,
+        "status": body.status.upper(),
+        "notes": body.notes,
+    }
+    # Selecting from subjects folds the existence check into the insert
+    subject_row = select(
+        Subject.id,
+        *(literal(v, SubjectVisit.__table__.c[k].type) for k, v in values.items()),
+    ).where(Subject.id == subject_id)
+    visit = (await db.execute(
+        insert(SubjectVisit)
+        .from_select(["subject_id", *values], subject_row)
+        .returning(*SubjectVisit.__table__.columns)
+    )).mappings().one_or_none()
+    if visit is None:
         raise HTTPException(status_code=404, detail="Subject not found")
-
-    visit = SubjectVisit(
-        subject_id=subject_id,
-        visit_id=body.visit_id,
-        scheduled_date=body.scheduled_date,
-        status=body.status.upper(),
-        notes=body.notes,
-    )
-    db.add(visit)
-    db.commit()
-    db.refresh(visit)
+    await db.commit()
+    subjects_cache.clear()
     return visit
 
 
 @router.get("/subjects/{subject_id}/visits", response_model=list[SubjectVisitOut])
-def list_visits(subject_id: UUID, db: Session = Depends(get_db)):
-    rows = db.execute(
+async def list_visits(subject_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    cache_key = ("visits", subject_id)
+    cached = subjects_cache.get(cache_key)
+    if cached is not None:
+        return _json(cached)
+    generation = subjects_cache.generation
+
+    rows = (await db.execute(
         select(SubjectVisit)
         .where(SubjectVisit.subject_id == subject_id)
         .order_by(SubjectVisit.scheduled_date.asc().nullslast())
-    ).scalars().all()
-    return rows
+    )).scalars().all()
+    body = list_json(SubjectVisitOut, rows)
+    subjects_cache.set(cache_key, body, generation)
+    return _json(body)
 
 
 @router.patch("/subjects/{subject_id}/visits/{visit_pk}", response_model=SubjectVisitOut)
-def update_visit(subject_id: UUID, visit_pk: UUID, body: SubjectVisitUpdate, db: Session = Depends(get_db)):
-    visit = db.get(SubjectVisit, visit_pk)
+async def update_visit(subject_id: UUID, visit_pk: UUID, body: SubjectVisitUpdate, db: AsyncSession = Depends(get_async_db)):
+    visit = await db.get(SubjectVisit, visit_pk)
     if not visit or visit.subject_id != subject_id:
         raise HTTPException(status_code=404, detail="Visit not found")
 
@@ -176,8 +222,9 @@ def update_visit(subject_id: UUID, visit_pk: UUID, body: SubjectVisitUpdate, db:
         if field in updates:
             setattr(visit, field, updates[field])
 
-    db.commit()
-    db.refresh(visit)
+    await db.commit()
+    subjects_cache.clear()
+    await db.refresh(visit)
     return visit
 
 
@@ -187,95 +234,117 @@ def update_visit(subject_id: UUID, visit_pk: UUID, body: SubjectVisitUpdate, db:
 
 
 @router.post("/subjects/{subject_id}/visits/{visit_pk}/dispense", response_model=KitAssignmentOut)
-def dispense_kit(
+async def dispense_kit(
     subject_id: UUID,
     visit_pk: UUID,
     body: DispenseRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    visit = db.get(SubjectVisit, visit_pk)
+    visit = await db.get(SubjectVisit, visit_pk)
     if not visit or visit.subject_id != subject_id:
         raise HTTPException(status_code=404, detail="Visit not found")
 
-    # If lot specified, issue from inventory
+    # If lot specified, issue from inventory: the debit only applies while
+    # enough stock is on hand
     if body.lot_id:
-        lot = db.get(InventoryLot, body.lot_id)
-        if not lot:
-            raise HTTPException(status_code=404, detail="Lot not found")
-        if lot.qty_on_hand < body.qty_dispensed:
+        debited = (await db.execute(
+            update(InventoryLot)
+            .where(InventoryLot.id == body.lot_id, InventoryLot.qty_on_hand >= body.qty_dispensed)
+            .values(qty_on_hand=InventoryLot.qty_on_hand - body.qty_dispensed)
+            .returning(InventoryLot.id)
+            .execution_options(synchronize_session=False)
+        )).scalar_one_or_none()
+        if debited is None:
+            if await db.get(InventoryLot, body.lot_id) is None:
+                raise HTTPException(status_code=404, detail="Lot not found")
             raise HTTPException(status_code=400, detail="Insufficient inventory in lot")
 
-        lot.qty_on_hand -= body.qty_dispensed
-        lot.updated_at = datetime.now(UTC)
-
-        txn = InventoryTransaction(
+        await db.execute(insert(InventoryTransaction).values(
             lot_id=body.lot_id,
             txn_type="ISSUE",
             qty=-body.qty_dispensed,
             reference_type="DISPENSE",
             reference_id=str(visit_pk),
             created_by=body.dispensed_by,
+        ))
+
+    ka = (await db.execute(
+        insert(KitAssignment)
+        .values(
+            subject_visit_id=visit_pk,
+            lot_id=body.lot_id,
+            product_id=body.product_id,
+            presentation_id=body.presentation_id,
+            qty_dispensed=body.qty_dispensed,
+            dispensed_at=datetime.now(UTC),
+            dispensed_by=body.dispensed_by,
         )
-        db.add(txn)
-
-    ka = KitAssignment(
-        subject_visit_id=visit_pk,
-        lot_id=body.lot_id,
-        product_id=body.product_id,
-        presentation_id=body.presentation_id,
-        qty_dispensed=body.qty_dispensed,
-        dispensed_at=datetime.now(UTC),
-        dispensed_by=body.dispensed_by,
-    )
-    db.add(ka)
-    db.commit()
-    db.refresh(ka)
+        .returning(*KitAssignment.__table__.columns)
+    )).mappings().one()
+    await db.commit()
+    subjects_cache.clear()
+    invalidate_positions()
     return ka
 
 
 @router.get("/subjects/{subject_id}/visits/{visit_pk}/kits", response_model=list[KitAssignmentOut])
-def list_kits(subject_id: UUID, visit_pk: UUID, db: Session = Depends(get_db)):
-    visit = db.get(SubjectVisit, visit_pk)
+async def list_kits(subject_id: UUID, visit_pk: UUID, db: AsyncSession = Depends(get_async_db)):
+    # Only found visits are cached, so a hit implies the 404 check passed
+    cache_key = ("kits", subject_id, visit_pk)
+    cached = subjects_cache.get(cache_key)
+    if cached is not None:
+        return _json(cached)
+    generation = subjects_cache.generation
+
+    visit = await db.get(SubjectVisit, visit_pk)
     if not visit or visit.subject_id != subject_id:
         raise HTTPException(status_code=404, detail="Visit not found")
 
-    rows = db.execute(
+    rows = (await db.execute(
         select(KitAssignment).where(KitAssignment.subject_visit_id == visit_pk)
-    ).scalars().all()
-    return rows
+    )).scalars().all()
+    body = list_json(KitAssignmentOut, rows)
+    subjects_cache.set(cache_key, body, generation)
+    return _json(body)
 
 
 @router.post("/subjects/{subject_id}/visits/{visit_pk}/kits/{kit_id}/return", response_model=KitAssignmentOut)
-def return_kit(
+async def return_kit(
     subject_id: UUID,
     visit_pk: UUID,
     kit_id: UUID,
     body: KitReturnRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    ka = db.get(KitAssignment, kit_id)
-    if not ka or ka.subject_visit_id != visit_pk:
+    ka = (await db.execute(
+        update(KitAssignment)
+        .where(KitAssignment.id == kit_id, KitAssignment.subject_visit_id == visit_pk)
+        .values(returned_qty=body.returned_qty, returned_at=datetime.now(UTC))
+        .returning(*KitAssignment.__table__.columns)
+        .execution_options(synchronize_session=False)
+    )).mappings().one_or_none()
+    if ka is None:
         raise HTTPException(status_code=404, detail="Kit assignment not found")
 
-    ka.returned_qty = body.returned_qty
-    ka.returned_at = datetime.now(UTC)
-
-    # Return to inventory if lot is tracked
-    if ka.lot_id:
-        lot = db.get(InventoryLot, ka.lot_id)
-        if lot:
-            lot.qty_on_hand += body.returned_qty
-            lot.updated_at = datetime.now(UTC)
-
-            txn = InventoryTransaction(
-                lot_id=ka.lot_id,
+    # Return to inventory if lot is tracked and still exists
+    if ka["lot_id"]:
+        restocked = (await db.execute(
+            update(InventoryLot)
+            .where(InventoryLot.id == ka["lot_id"])
+            .values(qty_on_hand=InventoryLot.qty_on_hand + body.returned_qty)
+            .returning(InventoryLot.id)
+            .execution_options(synchronize_session=False)
+        )).scalar_one_or_none()
+        if restocked is not None:
+            await db.execute(insert(InventoryTransaction).values(
+                lot_id=ka["lot_id"],
                 txn_type="RETURN",
                 qty=body.returned_qty,
                 reference_type="KIT_RETURN",
                 reference_id=str(kit_id),
-            )
-            db.add(txn)
+            ))
 
-    db.commit()
-    db.refresh(ka)
+    await db.commit()
+    subjects_cache.clear()
+    invalidate_positions()
     return ka
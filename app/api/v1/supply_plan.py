@@ -4,9 +4,10 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from app.db.session import get_db
+from app.db.session import get_async_db
 from app.models.inventory import InventoryLot, InventoryNode
 from app.models.scenario import ForecastRun, ScenarioVersion
 from app.schemas.supply_plan import SupplyPlanOut, SupplyPlanRequest
@@ -17,23 +18,24 @@ router = APIRouter()
 
 
 @router.post("/supply-plan/generate", response_model=SupplyPlanOut)
-def generate_plan(body: SupplyPlanRequest, db: Session = Depends(get_db)):
+async def generate_plan(body: SupplyPlanRequest, db: AsyncSession = Depends(get_async_db)):
     """Generate a supply plan for a scenario version.
 
     Uses current inventory from DB (or override via inventory_snapshot).
     """
-    sv = db.get(ScenarioVersion, body.scenario_version_id)
+    sv = await db.get(ScenarioVersion, body.scenario_version_id)
     if not sv:
         raise HTTPException(status_code=404, detail="ScenarioVersion not found")
 
-    # Run forecast
-    forecast_output = run_forecast(sv.payload)
+    # Run forecast; the engine and the planner are CPU-bound, so both stay
+    # off the event loop
+    forecast_output = await run_in_threadpool(run_forecast, sv.payload)
 
     # Get inventory: use snapshot if provided, else query DB
     if body.inventory_snapshot is not None:
         inventory = body.inventory_snapshot
     else:
-        inventory = _load_inventory_from_db(db)
+        inventory = await _load_inventory_from_db(db)
 
     # Also try to load from the scenario's starting_inventory
     if not inventory:
@@ -43,13 +45,13 @@ def generate_plan(body: SupplyPlanRequest, db: Session = Depends(get_db)):
             if items:
                 inventory = items
 
-    plan = generate_supply_plan(forecast_output, inventory, sv.payload)
+    plan = await run_in_threadpool(generate_supply_plan, forecast_output, inventory, sv.payload)
     return plan
 
 
-def _load_inventory_from_db(db: Session) -> list[dict]:
+async def _load_inventory_from_db(db: AsyncSession) -> list[dict]:
     """Load current inventory positions from the database."""
-    rows = db.execute(
+    rows = (await db.execute(
         select(
             InventoryNode.node_id,
             InventoryLot.product_id,
@@ -60,7 +62,7 @@ def _load_inventory_from_db(db: Session) -> list[dict]:
         )
         .join(InventoryLot, InventoryNode.id == InventoryLot.node_id)
         .where(InventoryLot.status == "RELEASED", InventoryLot.qty_on_hand > 0)
-    ).all()
+    )).all()
 
     return [
         {
@@ -2,16 +2,44 @@
 
 Provides a simple function to record audit events. Can be called from
 any endpoint or service to track critical actions.
+
+``log_action`` adds the entry to the caller's session so it commits with
+the caller's transaction. ``queue_action`` buffers the entry in memory
+instead; ``run_audit_flusher`` writes buffered entries in batches with a
+single multi-row INSERT, keeping the write off the request path.
+
+Buffered entries are never dropped: a failed batch goes back on the buffer
+and is retried with backoff, and whatever cannot be written at shutdown is
+spilled to ``AUDIT_SPILL_PATH`` and re-queued on the next start.
 """
 from __future__ import annotations
 
+import asyncio
+import logging
+import os
+import queue
+import uuid
+from datetime import UTC, datetime
 from typing import Any, Dict, Optional
 from uuid import UUID
 
+from pydantic_core import from_json, to_json
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+from app.core.settings import settings
+from app.db.session import SessionLocal
 from app.models.user import AuditLog
 
+logger = logging.getLogger(__name__)
+
+# Endpoints run on threadpool threads, so the buffer must be thread-safe.
+_pending: "queue.SimpleQueue[dict]" = queue.SimpleQueue()
+
+AUDIT_FLUSH_INTERVAL_SECONDS = 1.0
+AUDIT_FLUSH_MAX_BACKOFF_SECONDS = 60.0
+
 
 def log_action(
     db: Session,
@@ -36,3 +64,122 @@ def log_action(
     db.add(entry)
     # Don't commit here — let the caller manage the transaction
     return entry
+
+
+def queue_action(
+    action: str,
+    resource_type: str | None = None,
+    resource_id: str | None = None,
+    user_id: UUID | None = None,
+    username: str | None = None,
+    details: dict | None = None,
+    ip_address: str | None = None,
+) -> None:
+    """Buffer an audit log entry for the background flusher."""
+    _pending.put({
+        "id": uuid.uuid4(),
+        "user_id": user_id,
+        "username": username,
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "details": details,
+        "ip_address": ip_address,
+        # Stamp the event time now, not when the batch is flushed
+        "created_at": datetime.now(UTC),
+    })
+
+
+def _drain() -> list[dict]:
+    rows = []
+    while True:
+        try:
+            rows.append(_pending.get_nowait())
+        except queue.Empty:
+            return rows
+
+
+def flush_queued_actions() -> int:
+    """Write all buffered entries in one INSERT. Returns the number written.
+
+    On failure the entries are put back on the buffer and the error is
+    raised. Ids are assigned at queue time and existing ids are skipped, so
+    retrying a batch whose commit outcome was unknown cannot duplicate it.
+    """
+    rows = _drain()
+    if not rows:
+        return 0
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(AuditLog).on_conflict_do_nothing(index_elements=[AuditLog.id]), rows)
+        db.commit()
+    except Exception:
+        for row in rows:
+            _pending.put(row)
+        raise
+    finally:
+        db.close()
+    return len(rows)
+
+
+def spill_queued_actions(path: str | None = None) -> int:
+    """Append buffered entries to the spill file as JSON lines."""
+    rows = _drain()
+    if not rows:
+        return 0
+    with open(path or settings.AUDIT_SPILL_PATH, "ab") as f:
+        f.writelines(to_json(row) + b"\n" for row in rows)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(rows)
+
+
+def restore_spilled_actions(path: str | None = None) -> int:
+    """Re-queue entries spilled by a previous process, then remove the file."""
+    path = path or settings.AUDIT_SPILL_PATH
+    try:
+        with open(path, "rb") as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return 0
+    for line in lines:
+        row = from_json(line)
+        row["id"] = UUID(row["id"])
+        if row["user_id"]:
+            row["user_id"] = UUID(row["user_id"])
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+        _pending.put(row)
+    os.remove(path)
+    logger.warning("Re-queued %d spilled audit log entries from %s", len(lines), path)
+    return len(lines)
+
+
+def flush_or_spill_queued_actions() -> None:
+    """Shutdown path: write buffered entries, or spill them if the DB fails."""
+    try:
+        flush_queued_actions()
+    except Exception:
+        logger.exception("Failed to write audit log entries at shutdown")
+        count = spill_queued_actions()
+        logger.warning("Spilled %d audit log entries to %s", count, settings.AUDIT_SPILL_PATH)
+
+
+async def run_audit_flusher(interval: float = AUDIT_FLUSH_INTERVAL_SECONDS) -> None:
+    """Periodically flush buffered audit entries until cancelled.
+
+    Failed batches stay buffered; the delay doubles up to
+    ``AUDIT_FLUSH_MAX_BACKOFF_SECONDS`` until a flush succeeds again.
+    """
+    delay = interval
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await run_in_threadpool(flush_queued_actions)
+        except Exception:
+            delay = min(delay * 2, AUDIT_FLUSH_MAX_BACKOFF_SECONDS)
+            logger.exception(
+                "Failed to write %d audit log entries; retrying in %.0fs", _pending.qsize(), delay,
+            )
+        else:
+            delay = interval
@@ -1,47 +1,51 @@
 """JWT authentication and role-based access control.
 
-Uses PyJWT for token management and hashlib for password hashing (v1).
-Upgrade to passlib[bcrypt] or argon2 for production.
+Uses PyJWT for token management and Argon2id (argon2-cffi) for password
+hashing. PBKDF2-SHA256 hashes from v1 still verify and are replaced with
+Argon2id on the next successful login.
 """
 
 import hashlib
 import hmac
 import os
-import secrets
-from datetime import UTC, datetime, timedelta
+import time
+from datetime import UTC, datetime
 from typing import Optional
 from uuid import UUID
 
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from pydantic_core import from_json, to_json
 
+from app.core.cache import token_cache
 from app.core.settings import settings
-from app.db.session import get_db
 
 # JWT-like token using HMAC-SHA256 (no external dependency)
 # Format: base64(header.payload.signature)
 # For production: switch to PyJWT or python-jose
 
 import base64
-import json
 
 _SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-secret-change-me-in-production")
+_SECRET = _SECRET_KEY.encode()
 _ALGORITHM = "HS256"
 _TOKEN_EXPIRE_HOURS = 24
+_TOKEN_EXPIRE_SECONDS = _TOKEN_EXPIRE_HOURS * 3600
 
 security = HTTPBearer(auto_error=False)
 
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+
 
 def hash_password(password: str) -> str:
-    """Hash password with PBKDF2-SHA256. For v1 — upgrade to bcrypt/argon2 later."""
-    salt = secrets.token_hex(16)
-    dk = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), 100_000)
-    return f"{salt}${dk.hex()}"
+    """Hash password with Argon2id."""
+    return _password_hasher.hash(password)
 
 
-def verify_password(password: str, hashed: str) -> bool:
+def _verify_pbkdf2(password: str, hashed: str) -> bool:
+    """Verify a v1 ``salt$hex`` PBKDF2-SHA256 hash."""
     parts = hashed.split("$", 1)
     if len(parts) != 2:
         return False
@@ -50,45 +54,71 @@ def verify_password(password: str, hashed: str) -> bool:
     return hmac.compare_digest(dk.hex(), stored_hash)
 
 
+def verify_password(password: str, hashed: str) -> bool:
+    if not hashed.startswith("$argon2"):
+        return _verify_pbkdf2(password, hashed)
+    try:
+        return _password_hasher.verify(hashed, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def password_needs_rehash(hashed: str) -> bool:
+    """True for v1 PBKDF2 hashes and Argon2 hashes with outdated parameters."""
+    if not hashed.startswith("$argon2"):
+        return True
+    return _password_hasher.check_needs_rehash(hashed)
+
+
 def create_token(user_id: str, username: str, role: str, tenant_id: str | None = None) -> str:
     """Create a signed JWT-like token."""
+    now = int(time.time())
     payload = {
         "sub": user_id,
         "username": username,
         "role": role,
         "tenant_id": tenant_id,
-        "exp": (datetime.now(UTC) + timedelta(hours=_TOKEN_EXPIRE_HOURS)).isoformat(),
-        "iat": datetime.now(UTC).isoformat(),
+        "exp": now + _TOKEN_EXPIRE_SECONDS,
+        "iat": now,
     }
-    payload_bytes = base64.urlsafe_b64encode(json.dumps(payload).encode())
-    signature = hmac.new(
-        _SECRET_KEY.encode(), payload_bytes, hashlib.sha256
-    ).hexdigest()
+    payload_bytes = base64.urlsafe_b64encode(to_json(payload))
+    signature = hmac.digest(_SECRET, payload_bytes, "sha256").hex()
     return f"{payload_bytes.decode()}.{signature}"
 
 
 def decode_token(token: str) -> dict | None:
-    """Decode and verify a token. Returns payload dict or None."""
+    """Decode and verify a token. Returns payload dict or None.
+
+    Verified tokens with an epoch ``exp`` are cached, so repeat requests with
+    the same token skip the HMAC and JSON decode. Failures are never cached.
+    """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return None if time.time() > cached["exp"] else cached
+
     parts = token.split(".", 1)
     if len(parts) != 2:
         return None
 
     payload_b64, signature = parts
-    expected_sig = hmac.new(
-        _SECRET_KEY.encode(), payload_b64.encode(), hashlib.sha256
-    ).hexdigest()
+    expected_sig = hmac.digest(_SECRET, payload_b64.encode(), "sha256").hex()
 
     if not hmac.compare_digest(signature, expected_sig):
         return None
 
     try:
-        payload = json.loads(base64.urlsafe_b64decode(payload_b64))
+        payload = from_json(base64.urlsafe_b64decode(payload_b64))
     except Exception:
         return None
 
-    # Check expiry
+    # Check expiry: epoch seconds, or an ISO string in tokens issued before
+    # the switch (valid for at most _TOKEN_EXPIRE_HOURS after it)
     exp = payload.get("exp")
-    if exp:
+    if isinstance(exp, (int, float)):
+        if time.time() > exp:
+            return None
+        token_cache.set(token, payload)
+    elif exp:
         try:
             exp_dt = datetime.fromisoformat(exp)
             if datetime.now(UTC) > exp_dt:
@@ -109,7 +139,6 @@ class CurrentUser:
         self,
         request: Request,
         credentials: HTTPAuthorizationCredentials | None = Depends(security),
-        db: Session = Depends(get_db),
     ) -> dict:
         if credentials is None:
             raise HTTPException(
@@ -0,0 +1,73 @@
+"""Small in-process TTL cache for read-heavy endpoints.
+
+Entries live in the worker process: a write handled by one worker clears
+only that worker's copy, so other workers can serve a stale value for at
+most the TTL.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+POSITIONS_CACHE_TTL = 60.0
+SUBJECTS_CACHE_TTL = 60.0
+TOKEN_CACHE_TTL = 300.0
+
+
+class TTLCache:
+    """Bounded mapping whose entries expire ``ttl`` seconds after being set.
+
+    Thread-safe, since sync endpoints and ingest jobs write from the
+    threadpool.
+
+    ``generation`` changes on every ``clear``. A reader that captures it
+    before querying and passes it to ``set`` never stores a result that was
+    read before an invalidation that landed while the query ran.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+
+# /inventory/positions results, keyed by the query filters. Cleared whenever
+# app.core.positions refreshes the underlying view.
+positions_cache = TTLCache(POSITIONS_CACHE_TTL)
+
+# Encoded JSON bodies of the subject, visit and kit list endpoints, keyed by
+# endpoint and query parameters. Cleared by every subject/visit/kit write.
+subjects_cache = TTLCache(SUBJECTS_CACHE_TTL)
+
+# Verified token payloads keyed by the raw bearer token. Tokens are stateless,
+# so a hit grants nothing a fresh verify would not; expiry is still checked.
+token_cache = TTLCache(TOKEN_CACHE_TTL, maxsize=10_000)
@@ -0,0 +1,140 @@
+"""Bounded in-process queue for integration feed ingestion.
+
+Feed endpoints (IRT import, WMS receipt) validate the payload, ``submit`` a
+job and return 202 straight away; ``run_ingest_worker`` tasks started in the
+app lifespan drain the queue, running each job's blocking DB work in the
+threadpool. Clients poll the job for its result.
+
+Jobs live in this process only. At shutdown ``drain`` lets the workers
+finish the queue for up to ``INGEST_SHUTDOWN_TIMEOUT_SECONDS``; jobs still
+queued after that are logged and marked FAILED. The registry keeps the most
+recent ``INGEST_JOB_RETENTION`` jobs.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Any, Callable, Dict, Optional
+from uuid import UUID, uuid4
+
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_MAXSIZE = 1000
+INGEST_WORKERS = 2
+INGEST_JOB_RETENTION = 10_000
+INGEST_SHUTDOWN_TIMEOUT_SECONDS = 30.0
+
+
+class IngestQueueFull(Exception):
+    """Raised by ``submit`` when the queue is at capacity."""
+
+
+@dataclass
+class IngestJob:
+    id: UUID
+    kind: str
+    handler: Optional[Callable[[], BaseModel]] = field(repr=False)
+    status: str = "QUEUED"  # QUEUED | RUNNING | SUCCESS | FAILED
+    enqueued_at: datetime = field(default_factory=lambda: datetime.now(UTC))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+_queue: "asyncio.Queue[IngestJob]" = asyncio.Queue(maxsize=INGEST_QUEUE_MAXSIZE)
+_jobs: "OrderedDict[UUID, IngestJob]" = OrderedDict()
+_stats = {"submitted": 0, "dropped": 0, "succeeded": 0, "failed": 0}
+
+
+def submit(kind: str, handler: Callable[[], BaseModel]) -> IngestJob:
+    """Enqueue ``handler`` (a blocking callable returning a result model)."""
+    job = IngestJob(id=uuid4(), kind=kind, handler=handler)
+    try:
+        _queue.put_nowait(job)
+    except asyncio.QueueFull:
+        _stats["dropped"] += 1
+        logger.warning("Ingest queue full (%d jobs); rejected %s job", _queue.qsize(), kind)
+        raise IngestQueueFull
+    _stats["submitted"] += 1
+    _jobs[job.id] = job
+    while len(_jobs) > INGEST_JOB_RETENTION:
+        _jobs.popitem(last=False)
+    return job
+
+
+def get_job(job_id: UUID) -> IngestJob | None:
+    return _jobs.get(job_id)
+
+
+def ingest_stats() -> dict:
+    return {"queue_depth": _queue.qsize(), **_stats}
+
+
+async def run_ingest_worker() -> None:
+    """Process queued jobs one at a time until cancelled."""
+    while True:
+        job = await _queue.get()
+        job.status = "RUNNING"
+        job.started_at = datetime.now(UTC)
+        t0 = time.perf_counter()
+        try:
+            result = await run_in_threadpool(job.handler)
+        except Exception as e:
+            logger.exception("Ingest job %s (%s) failed", job.id, job.kind)
+            job.status = "FAILED"
+            job.error = str(e)
+            _stats["failed"] += 1
+        else:
+            job.status = "SUCCESS"
+            job.result = result.model_dump()
+            _stats["succeeded"] += 1
+        finally:
+            job.finished_at = datetime.now(UTC)
+            job.handler = None  # drop the payload reference
+            _queue.task_done()
+        logger.info(
+            "Ingest job %s (%s) %s in %.3fs, waited %.3fs, queue depth %d",
+            job.id,
+            job.kind,
+            job.status,
+            time.perf_counter() - t0,
+            (job.started_at - job.enqueued_at).total_seconds(),
+            _queue.qsize(),
+        )
+
+
+async def drain(timeout: float = INGEST_SHUTDOWN_TIMEOUT_SECONDS) -> None:
+    """Wait for queued jobs to finish; log and fail whatever is left."""
+    try:
+        await asyncio.wait_for(_queue.join(), timeout)
+        return
+    except asyncio.TimeoutError:
+        pass
+    for job in _jobs.values():
+        if job.status == "RUNNING":
+            logger.error("Ingest job %s (%s) was still running at shutdown", job.id, job.kind)
+    while True:
+        try:
+            job = _queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+        job.status = "FAILED"
+        job.error = "Not processed before shutdown"
+        job.finished_at = datetime.now(UTC)
+        job.handler = None
+        _stats["failed"] += 1
+        _queue.task_done()
+        logger.error(
+            "Ingest job %s (%s) enqueued at %s was not processed before shutdown",
+            job.id,
+            job.kind,
+            job.enqueued_at.isoformat(),
+        )
@@ -0,0 +1,55 @@
+"""Inventory positions rollup.
+
+``/inventory/positions`` reads ``mv_inventory_positions``, a materialized
+view of RELEASED stock per node/product/presentation. Writes that move stock
+call ``invalidate_positions``; ``run_positions_refresher`` (started in the
+app lifespan) refreshes the view at most once per interval while there are
+such writes, then drops the cached responses.
+
+Positions can therefore trail a write by up to the refresh interval. A
+write in another worker process is picked up by that worker's refresher.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+
+from sqlalchemy import text
+
+from app.core.cache import positions_cache
+from app.db.session import async_engine
+
+logger = logging.getLogger(__name__)
+
+POSITIONS_REFRESH_INTERVAL_SECONDS = 2.0
+
+# Set from threadpool endpoints and ingest jobs as well as the event loop
+_stale = threading.Event()
+
+
+def invalidate_positions() -> None:
+    """Mark the positions view out of date after a committed stock change."""
+    _stale.set()
+
+
+async def refresh_positions() -> None:
+    """Recompute the view without blocking readers, then drop cached results."""
+    async with async_engine.begin() as conn:
+        await conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_inventory_positions"))
+    positions_cache.clear()
+
+
+async def run_positions_refresher(interval: float = POSITIONS_REFRESH_INTERVAL_SECONDS) -> None:
+    """Refresh the positions view whenever it was invalidated, until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        if not _stale.is_set():
+            continue
+        # Cleared first so writes landing during the refresh trigger another
+        _stale.clear()
+        try:
+            await refresh_positions()
+        except Exception:
+            logger.exception("Failed to refresh mv_inventory_positions")
+            _stale.set()
@@ -0,0 +1,44 @@
+"""Fast paths for JSON responses.
+
+Returning rows with ``response_model=list[X]`` makes FastAPI validate them,
+dump the models back to Python dicts and then ``json.dumps`` the result.
+``list_response`` validates and encodes in pydantic-core instead, so the
+JSON bytes are produced without an intermediate Python object tree.
+Endpoints keep their ``response_model`` for the OpenAPI schema; FastAPI
+skips it when a ``Response`` is returned.
+
+``FastJSONResponse`` is the app's default response class: the same output
+as ``JSONResponse``, encoded by pydantic-core rather than the stdlib.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Iterable
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[model])
+
+
+def list_json(model: type[BaseModel], rows: Iterable[Any]) -> bytes:
+    """Encode ORM rows or row mappings as a JSON array of ``model``."""
+    adapter = _list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def list_response(
+    model: type[BaseModel], rows: Iterable[Any], headers: dict[str, str] | None = None,
+) -> Response:
+    """Serialize ORM rows or row mappings as a JSON array of ``model``."""
+    return Response(list_json(model, rows), media_type="application/json", headers=headers)
@@ -23,6 +23,33 @@ class Settings(BaseSettings):
         ...,
         validation_alias=AliasChoices("DATABASE_URL", "database_url"),
     )
+    # Per engine: the sync and async engines each keep their own pool
+    DB_POOL_SIZE: int = Field(
+        default=20,
+        validation_alias=AliasChoices("DB_POOL_SIZE", "db_pool_size"),
+    )
+    DB_MAX_OVERFLOW: int = Field(
+        default=20,
+        validation_alias=AliasChoices("DB_MAX_OVERFLOW", "db_max_overflow"),
+    )
+    DB_POOL_RECYCLE: int = Field(
+        default=1800,
+        validation_alias=AliasChoices("DB_POOL_RECYCLE", "db_pool_recycle"),
+    )
+    DB_POOL_TIMEOUT: int = Field(
+        default=30,
+        validation_alias=AliasChoices("DB_POOL_TIMEOUT", "db_pool_timeout"),
+    )
+    # Set when DATABASE_URL points at PgBouncer, which already pools
+    DB_NULL_POOL: bool = Field(
+        default=False,
+        validation_alias=AliasChoices("DB_NULL_POOL", "db_null_pool"),
+    )
+    # Buffered audit entries that could not be written at shutdown
+    AUDIT_SPILL_PATH: str = Field(
+        default="audit_spill.jsonl",
+        validation_alias=AliasChoices("AUDIT_SPILL_PATH", "audit_spill_path"),
+    )
 
 
 settings = Settings()
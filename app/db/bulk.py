@@ -0,0 +1,78 @@
+"""Bulk insert helper for ingest endpoints.
+
+Small batches go through ``insert()`` executemany, which SQLAlchemy batches
+into multi-row VALUES statements. Larger batches are streamed with
+PostgreSQL ``COPY ... FROM STDIN`` over the session's own connection, so
+they stay inside the request transaction. ``async_bulk_insert`` is the same
+for ``AsyncSession`` callers.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from psycopg.types.json import Jsonb
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.base import Base
+
+COPY_THRESHOLD = 100
+
+
+def _column_value(column, row: dict[str, Any]) -> Any:
+    # COPY bypasses SQLAlchemy, so client-side column defaults (uuid4 ids,
+    # created_at, status) have to be applied here.
+    if column.key in row:
+        value = row[column.key]
+    elif column.default is None:
+        value = None
+    elif column.default.is_callable:
+        value = column.default.arg(None)
+    else:
+        value = column.default.arg
+    if value is not None and isinstance(column.type, JSONB):
+        value = Jsonb(value)
+    return value
+
+
+def _copy_sql(model: type[Base], columns) -> str:
+    names = ", ".join(c.name for c in columns)
+    return f"COPY {model.__tablename__} ({names}) FROM STDIN"
+
+
+def bulk_insert(db: Session, model: type[Base], rows: list[dict[str, Any]], threshold: int = COPY_THRESHOLD) -> None:
+    """Insert ``rows`` (dicts keyed by column attribute) into ``model``'s table."""
+    if not rows:
+        return
+    # Pending ORM parents must exist before child rows reference them
+    db.flush()
+    if len(rows) < threshold:
+        db.execute(insert(model), rows)
+        return
+
+    columns = list(model.__table__.columns)
+    cursor = db.connection().connection.driver_connection.cursor()
+    with cursor.copy(_copy_sql(model, columns)) as copy:
+        for row in rows:
+            copy.write_row([_column_value(c, row) for c in columns])
+
+
+async def async_bulk_insert(
+    db: AsyncSession, model: type[Base], rows: list[dict[str, Any]], threshold: int = COPY_THRESHOLD,
+) -> None:
+    """``bulk_insert`` for an ``AsyncSession``."""
+    if not rows:
+        return
+    await db.flush()
+    if len(rows) < threshold:
+        await db.execute(insert(model), rows)
+        return
+
+    columns = list(model.__table__.columns)
+    raw = await (await db.connection()).get_raw_connection()
+    cursor = raw.driver_connection.cursor()
+    async with cursor.copy(_copy_sql(model, columns)) as copy:
+        for row in rows:
+            await copy.write_row([_column_value(c, row) for c in columns])
@@ -1,15 +1,47 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from app.core.settings import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
+# The default pool (5 + 10 overflow) runs dry under bursts of report and
+# ingest requests; recycle connections before server/proxy idle timeouts.
+# The compiled-SQL cache is sized above the default 500 so the per-filter
+# variants of every endpoint's statements stay resident.
+_ENGINE_OPTIONS = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
     pool_pre_ping=True,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    query_cache_size=1200,
 )
+if settings.DB_NULL_POOL:
+    # Behind PgBouncer in transaction mode: hand every checkout straight to
+    # the bouncer instead of pooling twice. psycopg must not use server-side
+    # prepared statements there, since consecutive transactions can land on
+    # different server connections.
+    _ENGINE_OPTIONS = dict(
+        poolclass=NullPool,
+        query_cache_size=1200,
+        connect_args={"prepare_threshold": None},
+    )
+
+engine = create_engine(settings.DATABASE_URL, **_ENGINE_OPTIONS)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# psycopg 3 speaks asyncio natively, so the same postgresql+psycopg URL
+# drives both engines.
+async_engine = create_async_engine(settings.DATABASE_URL, **_ENGINE_OPTIONS)
+
+# expire_on_commit=False: attributes must stay loaded after commit, since
+# response serialization happens outside the session and cannot lazy-load.
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False,
+)
+
 
 def get_db():
     db = SessionLocal()
@@ -17,3 +49,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
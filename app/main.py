@@ -1,6 +1,35 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from app.core.audit import flush_or_spill_queued_actions, restore_spilled_actions, run_audit_flusher
+from app.core.ingest import INGEST_WORKERS, drain as drain_ingest_queue, run_ingest_worker
+from app.core.positions import run_positions_refresher
+from app.core.responses import FastJSONResponse
 from app.core.settings import settings
+from app.db.session import async_engine, engine
 from app.api.v1.router import api_router
 
-app = FastAPI(title=settings.APP_NAME)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    restore_spilled_actions()
+    audit_flusher = asyncio.create_task(run_audit_flusher())
+    ingest_workers = [asyncio.create_task(run_ingest_worker()) for _ in range(INGEST_WORKERS)]
+    positions_refresher = asyncio.create_task(run_positions_refresher())
+    yield
+    positions_refresher.cancel()
+    # Jobs acknowledged with 202 are finished before the workers stop
+    await drain_ingest_queue()
+    for worker in ingest_workers:
+        worker.cancel()
+    audit_flusher.cancel()
+    # Don't drop audit entries buffered since the last tick
+    flush_or_spill_queued_actions()
+    # Close pooled connections instead of leaving them to the server's timeout
+    await async_engine.dispose()
+    engine.dispose()
+
+
+app = FastAPI(title=settings.APP_NAME, lifespan=lifespan, default_response_class=FastJSONResponse)
 app.include_router(api_router, prefix="/api/v1")
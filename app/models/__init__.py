@@ -1,6 +1,6 @@
 from app.models.study import Study  # noqa: F401
 from app.models.scenario import ForecastRun, Scenario, ScenarioVersion  # noqa: F401
-from app.models.inventory import InventoryLot, InventoryNode, InventoryTransaction  # noqa: F401
+from app.models.inventory import InventoryLot, InventoryNode, InventoryTransaction, InventoryVial  # noqa: F401
 from app.models.shipment import Shipment, ShipmentItem  # noqa: F401
 from app.models.subject import KitAssignment, Subject, SubjectVisit  # noqa: F401
 from app.models.user import AuditLog, User  # noqa: F401
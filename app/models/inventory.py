@@ -2,13 +2,19 @@ import uuid
 from datetime import UTC, datetime
 
 from sqlalchemy import (
+    Column,
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    MetaData,
     String,
+    Table,
     Text,
     UniqueConstraint,
+    func,
+    text,
 )
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -44,8 +50,42 @@ class InventoryLot(Base):
 
     __tablename__ = "inventory_lots"
     __table_args__ = (
-        UniqueConstraint("node_id", "product_id", "presentation_id", "lot_number",
-                         name="uq_lot_at_node"),
+        # One lot per node/product/presentation/lot number. NULLS NOT DISTINCT
+        # so lots without a presentation collide too (ON CONFLICT relies on it)
+        Index(
+            "uq_inventory_lots_lot_at_node",
+            "node_id",
+            "product_id",
+            "presentation_id",
+            "lot_number",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+        # Covers the RELEASED-stock position rollup with an index-only scan
+        Index(
+            "ix_inventory_lots_released_position",
+            "node_id",
+            "product_id",
+            "presentation_id",
+            postgresql_include=["qty_on_hand", "expiry_date"],
+            postgresql_where=text("status = 'RELEASED'"),
+        ),
+        # list_lots?status=RELEASED ordering / keyset pagination
+        Index(
+            "ix_inventory_lots_released_expiry",
+            "expiry_date",
+            "id",
+            postgresql_where=text("status = 'RELEASED'"),
+        ),
+        # Expiry-risk report, index-only
+        Index(
+            "ix_inventory_lots_expiry_risk",
+            "expiry_date",
+            postgresql_include=[
+                "node_id", "product_id", "presentation_id", "lot_number", "status", "qty_on_hand",
+            ],
+            postgresql_where=text("status = 'RELEASED' AND qty_on_hand > 0"),
+        ),
     )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -60,8 +100,9 @@ class InventoryLot(Base):
     qty_on_hand: Mapped[float] = mapped_column(Float, default=0.0)
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(UTC))
+    # Stamped by the database clock on insert and in every UPDATE statement
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC)
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
     node: Mapped["InventoryNode"] = relationship(back_populates="lots")
@@ -73,6 +114,10 @@ class InventoryTransaction(Base):
     """A change to inventory: receipt, issue, transfer, return, adjustment."""
 
     __tablename__ = "inventory_transactions"
+    __table_args__ = (
+        # list_transactions: newest-first keyset pages (scanned backwards)
+        Index("ix_inventory_transactions_created", "created_at", "id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     lot_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("inventory_lots.id"), index=True)
@@ -113,3 +158,20 @@ class InventoryVial(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(UTC))
 
     lot: Mapped["InventoryLot"] = relationship(back_populates="vials")
+
+
+# Read-only rollup of RELEASED stock, created by migration k1l2m3n4o5p6 and
+# refreshed by app.core.positions. Kept off Base.metadata so autogenerate
+# does not try to manage it as a table.
+inventory_positions_mv = Table(
+    "mv_inventory_positions",
+    MetaData(),
+    Column("study_id", UUID(as_uuid=True)),
+    Column("node_id", String(128)),
+    Column("node_name", String(256)),
+    Column("product_id", String(128)),
+    Column("presentation_id", String(128)),
+    Column("total_qty", Float),
+    Column("lot_count", Integer),
+    Column("earliest_expiry", DateTime(timezone=True)),
+)
@@ -1,7 +1,7 @@
 import uuid
 from datetime import UTC, datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint, text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -11,6 +11,11 @@ from app.db.base import Base
 
 class Scenario(Base):
     __tablename__ = "scenarios"
+    __table_args__ = (
+        # list_scenarios: ORDER BY created_at DESC LIMIT, optionally per study
+        Index("ix_scenarios_created", "created_at"),
+        Index("ix_scenarios_study_created", "study_id", "created_at"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -63,6 +68,16 @@ class ScenarioVersion(Base):
 
 class ForecastRun(Base):
     __tablename__ = "forecast_runs"
+    __table_args__ = (
+        # At most one SUCCESS run per cache key; older ones become SUPERSEDED
+        Index(
+            "uq_forecast_runs_cache",
+            "scenario_version_id",
+            "input_hash",
+            unique=True,
+            postgresql_where=text("status = 'SUCCESS'"),
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     scenario_version_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("scenario_versions.id"), index=True)
@@ -70,6 +85,7 @@ class ForecastRun(Base):
     engine_version: Mapped[str] = mapped_column(String(64), default=ENGINE_VERSION)
     input_hash: Mapped[str] = mapped_column(String(64), index=True)
     status: Mapped[str] = mapped_column(String(32), default="QUEUED")
+    # QUEUED | RUNNING | SUCCESS | FAILED | SUPERSEDED
 
     started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
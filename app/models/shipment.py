@@ -1,7 +1,7 @@
 import uuid
 from datetime import UTC, datetime
 
-from sqlalchemy import DateTime, Float, ForeignKey, String, Text
+from sqlalchemy import DateTime, Float, ForeignKey, Index, String, Text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -12,6 +12,11 @@ class Shipment(Base):
     """A shipment from one node to another (depot → site)."""
 
     __tablename__ = "shipments"
+    __table_args__ = (
+        # list_shipments: ORDER BY requested_at DESC LIMIT, optionally per status
+        Index("ix_shipments_requested", "requested_at"),
+        Index("ix_shipments_status_requested", "status", "requested_at"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 from datetime import datetime
+from enum import Enum
 from typing import Any, Dict, List, Optional, TYPE_CHECKING
 from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 if TYPE_CHECKING:
     pass
@@ -106,10 +107,19 @@ class LotWithVialsOut(LotOut):
 
 # --- Transactions ---
 
+class TxnType(str, Enum):
+    RECEIPT = "RECEIPT"
+    ISSUE = "ISSUE"
+    TRANSFER_OUT = "TRANSFER_OUT"
+    TRANSFER_IN = "TRANSFER_IN"
+    RETURN = "RETURN"
+    ADJUSTMENT = "ADJUSTMENT"
+
+
 class TransactionCreate(BaseModel):
     model_config = ConfigDict(extra="forbid")
     lot_id: UUID
-    txn_type: str = Field(..., description="RECEIPT | ISSUE | TRANSFER_OUT | TRANSFER_IN | RETURN | ADJUSTMENT")
+    txn_type: TxnType = Field(..., description="RECEIPT | ISSUE | TRANSFER_OUT | TRANSFER_IN | RETURN | ADJUSTMENT")
     qty: float
     from_node_id: Optional[UUID] = None
     to_node_id: Optional[UUID] = None
@@ -118,6 +128,12 @@ class TransactionCreate(BaseModel):
     notes: Optional[str] = None
     created_by: Optional[str] = None
 
+    @field_validator("txn_type", mode="before")
+    @classmethod
+    def _upper_txn_type(cls, v: Any) -> Any:
+        # Accepted case-insensitively, as before the enum
+        return v.upper() if isinstance(v, str) else v
+
 
 class TransactionOut(BaseModel):
     model_config = ConfigDict(extra="forbid")
@@ -11,6 +11,8 @@ export const useForecastRun = (runId: string) =>
     queryKey: ['forecast', 'runs', runId],
     queryFn: () => api.getForecastRun(runId),
     enabled: !!runId,
+    // Runs execute in the background — poll until they leave RUNNING
+    refetchInterval: (query) => (query.state.data?.status === 'RUNNING' ? 2000 : false),
   });
 
 export const useForecastCompare = (params: { scenario_id: string; a: number; b: number }) =>